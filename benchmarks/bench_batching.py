@@ -0,0 +1,96 @@
+"""Compare per-visitee and batched visits of many leaves.
+
+"leaves" measures the overhead of the engine on trivial leaves.  "lookups"
+reads each leaf's value from an SQLite table, with one query per leaf
+visited on its own, or one query per 500 leaves visited in a batch.  Run
+with `python benchmarks/bench_batching.py`.
+
+"""
+import functools
+import operator
+import sqlite3
+import timeit
+
+import doorbell
+
+
+@doorbell.Visitee.create
+class Leaf(object):
+    children = ()
+
+    def __init__(self, value):
+        self.value = value
+
+
+@doorbell.Visitee.create
+class Add(object):
+    def __init__(self, children):
+        self.children = children
+
+
+class Cascading(doorbell.CascadingVisitor):
+    iterative = True
+
+    def visit_Leaf(self, subject, children):
+        return subject.value
+
+    def visit_Add(self, subject, children):
+        return sum(children)
+
+
+class PerVisitee(doorbell.BatchingVisitor):
+    visit_Leaf = Cascading.visit_Leaf.function
+    visit_Add = Cascading.visit_Add.function
+
+
+class Batched(PerVisitee):
+    def visit_batch_Leaf(self, subjects, children):
+        return list(map(operator.attrgetter('value'), subjects))
+
+
+DB = sqlite3.connect(':memory:')
+DB.execute('CREATE TABLE value (key INTEGER PRIMARY KEY, value INTEGER)')
+DB.executemany('INSERT INTO value VALUES (?, ?)',
+               ((i, 2 * i) for i in range(1000)))
+
+
+def query(keys):
+    sql = 'SELECT key, value FROM value WHERE key IN ({0})'.format(
+        ', '.join('?' * len(keys)))
+    return dict(DB.execute(sql, keys))
+
+
+class CascadingLookup(Cascading):
+    def visit_Leaf(self, subject, children):
+        return query([subject.value])[subject.value]
+
+
+class PerVisiteeLookup(PerVisitee):
+    visit_Leaf = CascadingLookup.visit_Leaf.function
+
+
+class BatchedLookup(PerVisiteeLookup):
+    def visit_batch_Leaf(self, subjects, children):
+        keys = [subject.value for subject in subjects]
+        values = {}
+        for i in range(0, len(keys), 500):
+            values.update(query(list(set(keys[i:i + 500]))))
+        return [values[key] for key in keys]
+
+
+def tree(width, leaves):
+    return Add([Add([Leaf(i) for i in range(leaves)]) for j in range(width)])
+
+
+def bench(label, root, visitors, number=5):
+    for visitor in visitors:
+        timer = timeit.Timer(functools.partial(visitor.dispatch, root))
+        best = min(timer.repeat(repeat=3, number=number)) / number
+        print('{0:8s} {1:16s} {2:10.3f} ms'.format(
+            label, type(visitor).__name__, best * 1e3))
+
+
+if __name__ == '__main__':
+    bench('leaves', tree(1000, 100), (Cascading(), PerVisitee(), Batched()))
+    bench('lookups', tree(100, 100),
+          (CascadingLookup(), PerVisiteeLookup(), BatchedLookup()))
@@ -0,0 +1,100 @@
+"""Measure the per-call cost of visitor method binding.
+
+The "before" numbers emulate the previous binding, which created a
+`functools.partial` on every attribute access.  Run with
+`python benchmarks/bench_binding.py`.
+
+"""
+import functools
+import timeit
+
+import doorbell
+
+
+class partialmethod(object):
+    def __init__(self, wrapped_function, *args, **kwargs):
+        self.function = wrapped_function
+        self.args = args
+        self.kwargs = kwargs
+
+    def __get__(self, instance, *args, **kwargs):
+        if instance is None:
+            return self
+        return functools.partial(self.function, instance,
+                                 *self.args, **self.kwargs)
+
+
+def _visit_wrapper(self, *args, **kwargs):
+    return kwargs.pop('function')(self, *args, **kwargs)
+
+
+def _wrapping_wrapper(self, *args, **kwargs):
+    return kwargs['function'](self, *args)
+
+
+@doorbell.Visitee.create
+class Value(object):
+    pass
+
+
+class Visitor(doorbell.Visitor):
+    def visit_Value(self, obj):
+        return obj
+
+
+class Wrapping(doorbell.Visitor):
+    def _visit_wrapper(self, *args, **kwargs):
+        return kwargs['function'](self, *args)
+
+    def visit_Value(self, obj):
+        return obj
+
+
+def visit_Value(self, obj):
+    return obj
+
+
+class LegacyVisitor(object):
+    visit_Value = partialmethod(_visit_wrapper, function=visit_Value)
+
+
+class LegacyWrapping(object):
+    visit_Value = partialmethod(_wrapping_wrapper, function=visit_Value)
+
+
+def bench(label, visitor, number=1000000, dispatch=False):
+    node = Value()
+    if dispatch:
+        timer = timeit.Timer(functools.partial(visitor.dispatch, node))
+    else:
+        timer = timeit.Timer(functools.partial(node.accept, visitor))
+    best = min(timer.repeat(repeat=3, number=number)) / number
+    print('{0:20s} {1:8.1f} ns'.format(label, best * 1e9))
+
+
+def accept_children(visitor, nodes):
+    return [c.accept(visitor) for c in nodes]
+
+
+def dispatch_children(visitor, nodes):
+    # as the recursive CascadingVisitor visits children
+    handlers = visitor._handlers
+    bind = visitor._bind_handler
+    return [(handlers.get(type(c)) or bind(c))(c) for c in nodes]
+
+
+def bench_children(label, visit, visitor, number=10000):
+    nodes = [Value() for i in range(100)]
+    timer = timeit.Timer(functools.partial(visit, visitor, nodes))
+    best = min(timer.repeat(repeat=3, number=number)) / number / len(nodes)
+    print('{0:20s} {1:8.1f} ns'.format(label, best * 1e9))
+
+
+if __name__ == '__main__':
+    bench('before, no wrapper', LegacyVisitor())
+    bench('after, no wrapper', Visitor())
+    bench('before, wrapper', LegacyWrapping())
+    bench('after, wrapper', Wrapping())
+    bench('dispatch, no wrapper', Visitor(), dispatch=True)
+    bench_children('children, accept', accept_children, Visitor())
+    bench_children('children, dispatch', dispatch_children, Visitor())
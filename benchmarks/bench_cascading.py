@@ -0,0 +1,67 @@
+"""Compare recursive and iterative `CascadingVisitor` traversal.
+
+Run with `python benchmarks/bench_cascading.py`.
+
+"""
+import functools
+import operator
+import sys
+import timeit
+
+import doorbell
+
+
+@doorbell.Visitee.create
+class Value(object):
+    def __init__(self, value=0):
+        self.value = value
+        self.children = []
+
+
+@doorbell.Visitee.create
+class Add(Value):
+    pass
+
+
+class Recursive(doorbell.CascadingVisitor):
+    def visit_Value(self, obj, children):
+        return obj.value
+
+    def visit_Add(self, obj, children):
+        return functools.reduce(operator.add, children, 0)
+
+
+class Iterative(Recursive):
+    iterative = True
+
+
+def deep(depth):
+    root = node = Add()
+    for i in range(depth):
+        child = Add()
+        node.children.extend((child, Value(1)))
+        node = child
+    return root
+
+
+def wide(width):
+    root = Add()
+    for i in range(width):
+        node = Add()
+        node.children.extend(Value(1) for j in range(10))
+        root.children.append(node)
+    return root
+
+
+def bench(label, tree, number=20):
+    for visitor in (Recursive(), Iterative()):
+        timer = timeit.Timer(functools.partial(tree.accept, visitor))
+        best = min(timer.repeat(repeat=3, number=number)) / number
+        print('{0:8s} {1:10s} {2:10.3f} ms'.format(
+            label, type(visitor).__name__, best * 1e3))
+
+
+if __name__ == '__main__':
+    sys.setrecursionlimit(10000)
+    bench('deep', deep(1000))
+    bench('wide', wide(10000))
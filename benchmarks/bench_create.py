@@ -0,0 +1,40 @@
+"""Measure the cost of defining many node classes with `Visitee.create`.
+
+This approximates importing a grammar module with one decorated class per
+node type.  `define_schema` registers the same number of classes with a
+`NodeRegistry` but only uses ten of them.  Run with
+`python benchmarks/bench_create.py [N]`.
+
+"""
+import sys
+import timeit
+
+import doorbell
+
+
+def define(count):
+    for i in range(count):
+        doorbell.Visitee.create(type('Node{0}'.format(i), (object,), {}))
+
+
+def define_auto(count):
+    base = doorbell.Visitee.auto_create(type('Base', (object,), {}))
+    for i in range(count):
+        cls = type('Node{0}'.format(i), (base,), {})
+        doorbell.Visitee.stop_auto_create(cls)
+
+
+def define_schema(count, used=10):
+    schema = dict(('Node{0}'.format(i), {'children': ['left', 'right']})
+                  for i in range(count))
+    nodes = doorbell.NodeRegistry(schema)
+    for i in range(used):
+        getattr(nodes, 'Node{0}'.format(i))
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+    for function in (define, define_auto, define_schema):
+        best = min(timeit.repeat(lambda: function(count), repeat=5, number=1))
+        print('{0:14s} {1:5d} classes {2:8.2f} ms'.format(
+            function.__name__, count, best * 1e3))
@@ -0,0 +1,51 @@
+"""Compare copying scopes with chained `Scope` objects.
+
+Run with `python benchmarks/bench_descending.py`.
+
+"""
+import functools
+import timeit
+
+import doorbell
+
+
+@doorbell.Visitee.create
+class Block(object):
+    def __init__(self, names):
+        self.names = names
+        self.children = []
+
+
+class Copying(doorbell.DescendingVisitor):
+    def visit_Block(self, subject, scope):
+        scope = dict(scope)
+        scope.update(subject.names)
+        return scope
+
+
+class Chained(doorbell.DescendingVisitor):
+    def visit_Block(self, subject, scope):
+        return scope.child(subject.names)
+
+
+def tree(depth, width):
+    root = node = Block({'x0': 0})
+    for i in range(depth):
+        child = Block({'x{0}'.format(i + 1): i + 1})
+        node.children.append(child)
+        node.children.extend(Block({'y': i}) for j in range(width))
+        node = child
+    return root
+
+
+def bench(label, root, number=5):
+    for visitor, scope in ((Copying(), {}), (Chained(), doorbell.Scope())):
+        timer = timeit.Timer(functools.partial(visitor.dispatch, root, scope))
+        best = min(timer.repeat(repeat=3, number=number)) / number
+        print('{0:8s} {1:10s} {2:10.3f} ms'.format(
+            label, type(visitor).__name__, best * 1e3))
+
+
+if __name__ == '__main__':
+    bench('shallow', tree(10, 1000))
+    bench('deep', tree(1000, 10))
@@ -0,0 +1,86 @@
+"""Compare specialized and generic `WrappingVisitor` wrappers.
+
+Each shape is timed as defined, which uses the wrapper specialized for its
+hooks, and through a subclass overriding `_visit_wrapper`, which uses the
+generic wrapper.  Run with `python benchmarks/bench_wrapping.py`.
+
+"""
+import functools
+import timeit
+
+import doorbell
+
+
+@doorbell.Visitee.create
+class Value(object):
+    def __init__(self, value=0):
+        self.value = value
+        self.children = []
+
+
+@doorbell.Visitee.create
+class Add(Value):
+    pass
+
+
+class Plain(doorbell.WrappingVisitor):
+    def visit_Value(self, obj):
+        return obj.value
+
+
+class EachPost(Plain):
+    def _wrap_each_post(self, arg):
+        return arg
+
+
+class AllHooks(EachPost):
+    def _wrap_all_pre(self, *args):
+        return args
+
+    def _wrap_all_post(self, arg):
+        return arg
+
+
+class Cascading(doorbell.CascadingVisitor):
+    def visit_Value(self, obj, children):
+        return obj.value
+
+    def visit_Add(self, obj, children):
+        return sum(children)
+
+
+class CascadingPost(Cascading):
+    def _wrap_each_post(self, arg):
+        return arg
+
+
+def generic(cls):
+    class Generic(cls):
+        def _visit_wrapper(self, *args, **kwargs):
+            return super(Generic, self)._visit_wrapper(*args, **kwargs)
+    return Generic
+
+
+def tree(width=100, depth=3):
+    if depth == 0:
+        return Value(1)
+    node = Add()
+    node.children.extend(tree(width, depth - 1) for i in range(width // 10))
+    return node
+
+
+def bench(cls, node, number):
+    for visitor in (generic(cls)(), cls()):
+        timer = timeit.Timer(functools.partial(node.accept, visitor))
+        best = min(timer.repeat(repeat=3, number=number)) / number
+        label = 'generic' if visitor.__class__ is not cls else 'specialized'
+        print('{0:14s} {1:12s} {2:10.2f} us'.format(
+            cls.__name__, label, best * 1e6))
+
+
+if __name__ == '__main__':
+    for cls in (Plain, EachPost, AllHooks):
+        bench(cls, Value(1), 200000)
+    root = tree()
+    for cls in (Cascading, CascadingPost):
+        bench(cls, root, 200)
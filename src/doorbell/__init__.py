@@ -2,11 +2,18 @@
 
 """
 import abc
+import bisect
 import collections
 import functools
+import heapq
 import inspect
+import itertools
+import math
+import random
 import re
-import textwrap
+import sys
+import types
+import weakref
 
 from . import _version
 from . import _six
@@ -15,11 +22,43 @@ name = 'doorbell'
 __version__ = _version.get_versions()['version']
 
 
+class _Signal(object):
+    """a unique constant, compared by identity"""
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+    def __reduce__(self):
+        # unpickle as the module constant
+        return self.name
+
+
+#: event yielded by :func:`Visitor.walk` before the children of a visitee
+ENTER = _Signal('ENTER')
+#: event yielded by :func:`Visitor.walk` after the children of a visitee
+LEAVE = _Signal('LEAVE')
+#: signal sent to :func:`Visitor.walk`, or returned by
+#: :func:`CascadingVisitor._pre_visit`, to skip the children of a visitee
+SKIP = _Signal('SKIP')
+#: signal returned by :func:`CascadingVisitor._pre_visit` to stop visiting
+STOP = _Signal('STOP')
+
+
+_name_re = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*\Z')
+_accept_functions = {}
+
+
 def _create_accept(name):
     """create an accept method from visitor method name
 
     The created method calls the visitor method named
-    "visit_<name>".
+    "visit_<name>", or, if a :class:`Visitor` has no such method, the
+    method :func:`Visitor.dispatch` would use instead.  Accept methods are
+    shared: the same name always gives the same function.
 
     Args:
         name (str): visitor method suffix
@@ -30,75 +69,241 @@ def _create_accept(name):
 
     """
     name = str(name)
-
-    accept_definition = textwrap.dedent("""
-        def accept(self, visitor):
-            return visitor.visit_{0!s}(self)
-        """.format(name))
-
-    # check string before eval
-    basic = "[A-Za-z_][A-Za-z0-9_]*"
-    name_re = re.compile('^' + basic + '$')
-    name_match = name_re.match(name)
-    accept_re = re.compile(
-        r'^ *return visitor.' + basic + r'\(self\)$',
-        re.MULTILINE)
-    accept_match = accept_re.search(accept_definition)
-    if name_match is None or accept_match is None:
+    try:
+        return _accept_functions[name]
+    except KeyError:
+        pass
+    if _name_re.match(name) is None:
         raise ValueError('Invalid visitor method name ' + name)
 
-    locals_ = {}
-    globals_ = {}
-    exec(accept_definition, globals_, locals_)
-    locals_['accept']._autocreate = name
-    return locals_['accept']
+    method_name = 'visit_' + name
+
+    def accept(self, visitor):
+        try:
+            method = getattr(visitor, method_name)
+        except AttributeError:
+            if not isinstance(visitor, Visitor):
+                raise
+            method = visitor._inherited_method(type(self), method_name)
+        return method(self)
+
+    accept._autocreate = name
+    _accept_functions[name] = accept
+    return accept
+
+
+def _create_super_accept(cls):
+    """create an accept method that calls the accept method after `cls`"""
+    def accept(self, visitor):
+        return super(cls, self).accept(visitor)
+
+    accept._autocreate = None
+    return accept
+
+
+def _is_visitee_class(cls):
+    """whether `cls` derives from :class:`Visitee`
+
+    Unlike `issubclass`, this does not consult the ABC subclass hooks, which
+    walk every existing Visitee subclass when `cls` is not one.
+
+    """
+    return Visitee in getattr(cls, '__mro__', ())
+
+
+def _accept(visitor, subject, *args):
+    """visit `subject` through its accept method"""
+    return subject.accept(visitor, *args)
+
+
+def _accept_name(subject):
+    """find the name of the visitor method called by `subject.accept`
+
+    Only accept methods created by :func:`Visitee.create` and
+    :func:`Visitee.auto_create` are known to do nothing but call a visitor
+    method, so only their name is used; other accept methods may choose the
+    method from the visitee's state, pass extra arguments or use the
+    visitor's attributes, so they must be called.
+
+    Returns:
+        the visitor method name, or None if the visitee must be visited
+        through its accept method
+
+    """
+    name = getattr(getattr(type(subject), 'accept', None), '_autocreate', None)
+    if name is None:
+        return None
+    return 'visit_' + name
+
+
+def _auto_accept(name, bases):
+    """create the accept method for a new subclass of an auto_create class
+
+    Returns:
+        the accept method, or None if no base uses auto_create or it has been
+        stopped
+
+    Raises:
+        ValueError: if the visitor method name is already used
+
+    """
+    has_auto = [hasattr(i, '_visitee_auto_names') for i in bases]
+    if not any(has_auto):
+        return None
+    parent = bases[has_auto.index(True)]
+    if parent._visitee_auto_function is None:
+        # auto_create has been stopped
+        return None
+    accept_name = parent._visitee_auto_function(name)
+    parent._visitee_auto_names[accept_name] += 1
+    if parent._visitee_auto_names[accept_name] > 1:
+        msg = ("Visitor method name already used: " +
+               accept_name)
+        raise ValueError(msg)
+    return _create_accept(accept_name)
+
+
+def _stop_accept(cls):
+    """create the accept method for a class decorated by stop_auto_create
+
+    Raises:
+        ValueError: if auto_create was not used on a parent class
+
+    """
+    if not hasattr(cls, '_visitee_auto_names'):
+        raise ValueError('auto_create not yet applied')
+    accept = cls.__dict__.get('accept')
+    if accept and getattr(accept, '_autocreate') is not None:
+        # need to remove auto-created-name
+        cls._visitee_auto_names[accept._autocreate] -= 1
+    # create a super method
+    return _create_super_accept(cls)
+
+
+def _virtual_init_subclass(cls):
+    """create `__init_subclass__` for a class decorated in place
+
+    Subclasses of decorated classes that do not derive from :class:`Visitee`
+    are not created by :class:`_MetaVisitee`, so this hook gives them their
+    type tag and, if :func:`Visitee.auto_create` was applied, their accept
+    method.  Requires Python 3.6.
+
+    """
+    original = vars(cls).get('__init_subclass__')
+
+    def __init_subclass__(subclass, **kwargs):
+        if original is None:
+            super(cls, subclass).__init_subclass__(**kwargs)
+        else:
+            original.__get__(None, subclass)(**kwargs)
+        _tag_class(subclass)
+        if 'accept' not in vars(subclass):
+            accept = _auto_accept(subclass.__name__, subclass.__bases__)
+            if accept is not None:
+                subclass.accept = accept
+
+    return classmethod(__init_subclass__)
+
+
+def _install(cls, attrs):
+    """set attributes on a class in place and make it a Visitee
+
+    Classes that do not derive from :class:`Visitee` are registered as
+    virtual subclasses, so their MRO is unchanged, and given a type tag and
+    an `__init_subclass__` hook the first time they are decorated.
+
+    """
+    for k, v in attrs.items():
+        setattr(cls, k, v)
+    if _is_visitee_class(cls):
+        cls.__abstractmethods__ = cls.__abstractmethods__ - frozenset(attrs)
+    else:
+        Visitee.register(cls)
+        if '_tag' not in vars(cls):
+            _tag_class(cls)
+            cls.__init_subclass__ = _virtual_init_subclass(cls)
+    return cls
+
+
+# Visitee classes, keyed by type tag
+_visitee_classes = weakref.WeakValueDictionary()
+_next_tag = itertools.count()
+
+
+def _tag_class(cls):
+    """give a Visitee class the next integer type tag"""
+    cls._tag = next(_next_tag)
+    _visitee_classes[cls._tag] = cls
 
 
 class _MetaVisitee(abc.ABCMeta):
+    """metaclass of :class:`Visitee`
+
+    Every Visitee class, including classes decorated in place and their
+    subclasses, is given a small integer tag, stored as the `_tag` class
+    attribute.  Tags are assigned in order and never reused, so they can
+    encode node types compactly (see :func:`Visitee.type_tag` and
+    :func:`Visitee.tagged_class`).  Classes merely registered with
+    :func:`Visitee.register` are not modified, so they have no tag of their
+    own.
+
+    """
     def __new__(cls, *args, **kwargs):
         name, bases, attrs = args[:3]
         if 'accept' not in attrs:
-            has_auto = [hasattr(i, '_visitee_auto_names') for i in bases]
-            if any(has_auto):
-                parent = bases[has_auto.index(True)]
-                if parent._visitee_auto_function is None:
-                    # auto_create has been stopped
-                    pass
-                else:
-                    accept_name = parent._visitee_auto_function(name)
-                    parent._visitee_auto_names[accept_name] += 1
-                    if parent._visitee_auto_names[accept_name] > 1:
-                        msg = ("Visitor method name already used: " +
-                               accept_name)
-                        raise ValueError(msg)
-                    accept = _create_accept(accept_name)
-                    attrs['accept'] = accept
-        return super(_MetaVisitee, cls).__new__(cls, *args, **kwargs)
+            accept = _auto_accept(name, bases)
+            if accept is not None:
+                attrs['accept'] = accept
+        new = super(_MetaVisitee, cls).__new__(cls, *args, **kwargs)
+        _tag_class(new)
+        return new
 
 
 class Visitee(_six.with_metaclass(_MetaVisitee, object)):
-    """a visited object"""
+    """a visited object
+
+    Visitee has empty `__slots__`, as do the classes created by its
+    decorators, so decorating a class that declares `__slots__` does not add
+    an instance dictionary.
+
+    """
+    __slots__ = ()
+
     @staticmethod
-    def stop_auto_create(arg):
+    def stop_auto_create(arg=None, inplace=False):
         """Stop auto-creating accept methods
 
+        Args:
+            arg: the decorated class
+            inplace (bool): modify the class instead of creating a subclass
+                            (see :func:`Visitee.create`)
+
         Raises:
             ValueError: if auto_create was not used on a parent class
 
         """
-        return Visitee.auto_create(arg, stop=True)
+        if arg is None:
+            return functools.partial(Visitee.stop_auto_create,
+                                     inplace=inplace)
+        return Visitee.auto_create(arg, stop=True, inplace=inplace)
 
     @staticmethod
-    def auto_create(arg, function=None, stop=False):
+    def auto_create(arg=None, function=None, stop=False, inplace=False):
         """Decorator to automatically create accept methods on subclasses
 
         Also creates on the current class.  Single argument can be a callable
         (see :func:`Visitee.create`).  The argument *cannot* be a string.
 
+        With `inplace`, the accept method and bookkeeping are set on the
+        decorated class itself (see :func:`Visitee.create`).  Accept methods
+        are then created for subclasses of a class that does not derive from
+        :class:`Visitee` by `__init_subclass__`, which requires Python 3.6.
+
         Args:
             arg (callable): optional argument
             function: *internal use*
             stop: *internal use*
+            inplace (bool): modify the class instead of creating a subclass
 
         Raises:
             ValueError: if a subclass creates an accept method that uses
@@ -127,48 +332,34 @@ class Visitee(_six.with_metaclass(_MetaVisitee, object)):
                 raise ValueError('Invalid argument ' + repr(function))
 
             attr = {}
+            applied = hasattr(arg, '_visitee_auto_names')
 
             if stop:
                 function = None
-                if not (issubclass(arg, Visitee)
-                        and hasattr(arg, '_visitee_auto_names')):
-                    raise ValueError('auto_create not yet applied')
-                else:
-                    accept = arg.__dict__.get('accept')
-                    if accept and getattr(accept, '_autocreate') is not None:
-                        # need to remove auto-created-name
-                        arg._visitee_auto_names[accept._autocreate] -= 1
-                    # create a super method
-                    locals_ = {}
-                    globals_ = {
-                        'SuperClass': arg,
-                        }
-                    accept_definition = textwrap.dedent("""
-                        def accept(self, visitor):
-                            return super(SuperClass, self).accept(visitor)
-                        """)
-                    exec(accept_definition, globals_, locals_)
-                    attr['accept'] = locals_['accept']
-                    attr['accept']._autocreate = None
+                attr['accept'] = _stop_accept(arg)
             else:
                 attr['accept'] = _create_accept(name)
 
             attr['_visitee_auto_function'] = staticmethod(function)
 
-            if not (issubclass(arg, Visitee)
-                    and hasattr(arg, '_visitee_auto_names')):
+            if not applied:
                 # auto_create has not yet been applied
                 bases = (arg, Visitee)
                 attr['_visitee_auto_names'] = collections.Counter((name,))
             else:
                 # if else, this is overriding a previous auto_create
                 bases = (arg, )
+
+            if inplace:
+                return _install(arg, attr)
+            attr['__slots__'] = ()
             return type(arg.__name__, bases, attr)
         else:
-            return functools.partial(Visitee.auto_create, function=arg)
+            return functools.partial(Visitee.auto_create, function=arg,
+                                     inplace=inplace)
 
     @staticmethod
-    def create(arg, name=None):
+    def create(arg=None, name=None, inplace=False):
         """Decorator to create accept method on class
 
         Pass a string as the argument so that the accept method calls
@@ -198,9 +389,23 @@ class Visitee(_six.with_metaclass(_MetaVisitee, object)):
         ...    #     return visitor.visit_Bob(self)
         ...    pass
 
+        By default, the decorator returns a subclass of the decorated class
+        and :class:`Visitee`.  Pass `inplace` to instead set the accept method
+        on the decorated class, keeping its MRO unchanged; a class that does
+        not derive from :class:`Visitee` is registered as a virtual subclass:
+
+        >>> @Visitee.create('Person', inplace=True)
+        ... class Harry(object):
+        ...    pass
+        >>> Harry.__mro__ == (Harry, object)
+        True
+        >>> isinstance(Harry(), Visitee)
+        True
+
         Args:
             arg (callable|str): optional argument
             name: *internal use*
+            inplace (bool): modify the class instead of creating a subclass
 
         """
         if inspect.isclass(arg):
@@ -209,15 +414,49 @@ class Visitee(_six.with_metaclass(_MetaVisitee, object)):
             elif name is None:
                 name = arg.__name__
 
-            if issubclass(arg, Visitee):
+            if _is_visitee_class(arg):
                 bases = (arg,)
             else:
                 bases = (arg, Visitee)
 
             accept = _create_accept(name)
-            return type(arg.__name__, bases, {'accept': accept})
+            if inplace:
+                return _install(arg, {'accept': accept})
+            attrs = {'accept': accept, '__slots__': ()}
+            return type(arg.__name__, bases, attrs)
         else:
-            return functools.partial(Visitee.create, name=arg)
+            return functools.partial(Visitee.create, name=arg,
+                                     inplace=inplace)
+
+    @staticmethod
+    def type_tag(cls):
+        """Get the integer type tag of a Visitee class.
+
+        >>> @Visitee.create
+        ... class Leaf(object):
+        ...     pass
+        >>> Visitee.tagged_class(Visitee.type_tag(Leaf)) is Leaf
+        True
+
+        Raises:
+            ValueError: if `cls` has no tag of its own, as for classes
+                        merely registered with :func:`Visitee.register`
+
+        """
+        try:
+            return vars(cls)['_tag']
+        except KeyError:
+            raise ValueError('{0} has no type tag'.format(cls.__name__))
+
+    @staticmethod
+    def tagged_class(tag):
+        """Get the Visitee class with an integer type tag.
+
+        Raises:
+            KeyError: if no class has the tag, or the class no longer exists
+
+        """
+        return _visitee_classes[tag]
 
     @abc.abstractmethod
     def accept(self, visitor):
@@ -233,6 +472,268 @@ class Visitee(_six.with_metaclass(_MetaVisitee, object)):
         raise NotImplementedError()
 
 
+def _node_children(self):
+    """children of a node class created by :class:`NodeRegistry`"""
+    children = []
+    for field, sequence in self._child_fields:
+        value = getattr(self, field)
+        if sequence:
+            children.extend(value)
+        elif value is not None:
+            children.append(value)
+    return children
+
+
+def _node_init(self, *args, **kwargs):
+    """initialize a node class created by :class:`NodeRegistry`"""
+    fields = self._fields
+    if len(args) > len(fields):
+        raise TypeError('{0} takes at most {1} arguments'.format(
+            type(self).__name__, len(fields)))
+    values = dict(zip(fields, args))
+    for key, value in kwargs.items():
+        if key not in fields or key in values:
+            raise TypeError('{0} got an unexpected or repeated argument '
+                            '{1!r}'.format(type(self).__name__, key))
+        values[key] = value
+    for field in fields:
+        if field in values:
+            value = values[field]
+        elif field in self._sequence_fields:
+            value = []
+        else:
+            value = None
+        setattr(self, field, value)
+
+
+class NodeRegistry(object):
+    """Lazily created Visitee classes from a declarative schema.
+
+    The schema maps each class name to a dict of options, all optional:
+
+    - `bases`: base classes, given as names in the schema or as classes
+    - `fields`: names of attributes that are not children
+    - `children`: names of child attributes; a name prefixed by `*` holds a
+      sequence of children
+    - `visit`: visitor method suffix, as for :func:`Visitee.create`; defaults
+      to the class name
+    - `slots`: additional `__slots__`
+
+    The schema is validated when the registry is created, but each class is
+    created only when first accessed as an attribute of the registry.
+    Created classes have `__slots__`, an `__init__` taking the fields and
+    children of the class and its bases (in that order), and a `children`
+    property that skips children which are None.  To make the classes
+    attributes of a module, assign the registry's `__getattr__` to the
+    module's `__getattr__` (Python 3.7):
+
+    >>> nodes = NodeRegistry({
+    ...     'Expr': {},
+    ...     'Num': {'bases': ['Expr'], 'fields': ['value']},
+    ...     'Add': {'bases': ['Expr'], 'children': ['left', 'right']},
+    ... })
+    >>> add = nodes.Add(nodes.Num(1), nodes.Num(2))
+    >>> [i.value for i in add.children]
+    [1, 2]
+
+    Created classes belong to `module`, or else to the module that created
+    the registry.  They can only be pickled if they are attributes of their
+    module, as they are when `module` is given.
+
+    Args:
+        schema (dict): class options, keyed by class name
+        module (str): name of the module the classes belong to; created
+                      classes are also set as attributes of this module
+
+    Raises:
+        ValueError: if the schema is invalid
+
+    """
+    _options = frozenset(('bases', 'fields', 'children', 'visit', 'slots'))
+
+    def __init__(self, schema, module=None):
+        self._schema = {}
+        self._classes = {}
+        self._module = module
+        if module is None:
+            # like collections.namedtuple
+            module = sys._getframe(1).f_globals.get('__name__', '__main__')
+        self._class_module = module
+        for name, options in schema.items():
+            self._schema[name] = self._validate(name, options, schema)
+        layouts = {}
+        for name in self._schema:
+            self._layout(name, layouts)
+
+    def _validate(self, name, options, schema):
+        unknown = set(options) - self._options
+        if unknown:
+            raise ValueError('Unknown options for {0}: {1}'.format(
+                name, ', '.join(sorted(unknown))))
+        options = dict(options)
+        options['children'] = tuple(options.get('children', ()))
+        fields = [i.lstrip('*') for i in options['children']]
+        fields[:0] = options.get('fields', ())
+        for i in [name, options.get('visit', name)] + fields:
+            if _name_re.match(str(i)) is None:
+                raise ValueError('Invalid name in schema: ' + str(i))
+        self._validate_bases(name, options, schema)
+        options['fields'] = tuple(fields)
+        return options
+
+    @staticmethod
+    def _validate_bases(name, options, schema):
+        """Check that the bases of `name` exist and do not include itself."""
+        for base in options.get('bases', ()):
+            if not (inspect.isclass(base) or base in schema):
+                raise ValueError('Unknown base for {0}: {1}'.format(
+                    name, base))
+        pending = list(options.get('bases', ()))
+        seen = set()
+        while pending:
+            base = pending.pop()
+            if base == name:
+                raise ValueError('Cyclic bases for ' + name)
+            if not inspect.isclass(base) and base not in seen:
+                seen.add(base)
+                pending.extend(schema.get(base, {}).get('bases', ()))
+
+    def _ancestors(self, name):
+        """Find all bases of a class, direct or not.
+
+        Args:
+            name: a class name in the schema, or a class
+
+        Returns:
+            set: the class names in the schema and the classes
+
+        """
+        if inspect.isclass(name):
+            return set(name.__mro__[1:])
+        found = set()
+        pending = list(self._schema[name].get('bases', ()))
+        while pending:
+            base = pending.pop()
+            if base in found:
+                continue
+            found.add(base)
+            if inspect.isclass(base):
+                found.update(base.__mro__[1:])
+            else:
+                pending.extend(self._schema[base].get('bases', ()))
+        return found
+
+    def _slots(self, name):
+        """Find the `__slots__` of a class: its fields that are not
+        inherited, then its additional slots."""
+        inherited = set()
+        for base in self._ancestors(name):
+            if inspect.isclass(base):
+                inherited.update(getattr(base, '_fields', ()))
+            else:
+                inherited.update(self._schema[base]['fields'])
+        options = self._schema[name]
+        return tuple(i for i in options['fields'] if i not in inherited) + (
+            tuple(options.get('slots', ())))
+
+    def _layout(self, name, layouts):
+        """Find the nearest class, of a class and its bases, that adds slots.
+
+        Like Python, reject classes whose bases add slots independently of
+        each other, since their instance layouts conflict.
+
+        Args:
+            name: a class name in the schema, or a class
+            layouts (dict): layouts already found, keyed by class name
+
+        Raises:
+            ValueError: if the layouts of the bases of a class conflict
+
+        """
+        if inspect.isclass(name):
+            return _solid_base(name)
+        if name not in layouts:
+            layout = object
+            for base in self._schema[name].get('bases', ()):
+                other = self._layout(base, layouts)
+                if self._extends(other, layout):
+                    layout = other
+                elif not self._extends(layout, other):
+                    raise ValueError('Conflicting slots in the bases of ' +
+                                     name)
+            layouts[name] = name if self._slots(name) else layout
+        return layouts[name]
+
+    def _extends(self, layout, base):
+        """Whether the layout `layout` is `base` or derives from it."""
+        return (base is object or layout == base or
+                base in self._ancestors(layout))
+
+    def __getattr__(self, name):
+        # special names, and any name before __init__, as when copying
+        schema = vars(self).get('_schema', {})
+        if name.startswith('__') or name not in schema:
+            raise AttributeError('no node class named ' + repr(name))
+        options = schema[name]
+        try:
+            return self._classes[name]
+        except KeyError:
+            pass
+        cls = self._create(name, options)
+        self._classes[name] = cls
+        if self._module is not None:
+            setattr(sys.modules[self._module], name, cls)
+        return cls
+
+    def __dir__(self):
+        return sorted(self._schema)
+
+    def __contains__(self, name):
+        return name in self._schema
+
+    def _create(self, name, options):
+        bases = tuple(
+            getattr(self, i) if isinstance(i, _six.string_types) else i
+            for i in options.get('bases', ()))
+        if not any(_is_visitee_class(i) for i in bases):
+            bases += (Visitee,)
+        fields = _inherited(bases, '_fields') + options['fields']
+        child_fields = _inherited(bases, '_child_fields') + tuple(
+            (i.lstrip('*'), i.startswith('*')) for i in options['children'])
+        attrs = {
+            '__slots__': self._slots(name),
+            '__module__': self._class_module,
+            '_fields': tuple(collections.OrderedDict.fromkeys(fields)),
+            '_child_fields': tuple(
+                collections.OrderedDict.fromkeys(child_fields)),
+            '_sequence_fields': frozenset(
+                i for i, sequence in child_fields if sequence),
+            'accept': _create_accept(options.get('visit', name)),
+        }
+        if not any(hasattr(i, '_fields') for i in bases):
+            attrs['__init__'] = _node_init
+            attrs['children'] = property(_node_children)
+        return type(name, bases, attrs)
+
+
+def _inherited(bases, name):
+    """concatenate the tuples named `name` on each of `bases`"""
+    return sum((getattr(i, name, ()) for i in bases), ())
+
+
+def _solid_base(cls):
+    """the nearest class, along the `__base__` chain of `cls`, that adds
+    slots, or object"""
+    while cls is not object:
+        slots = vars(cls).get('__slots__', ())
+        if isinstance(slots, _six.string_types):
+            slots = (slots,)
+        if set(slots) - set(('__dict__', '__weakref__')):
+            return cls
+        cls = cls.__base__
+    return object
+
+
 class _VisitorMethod(object):
     """a method that is used as a visitor
 
@@ -243,27 +744,198 @@ class _VisitorMethod(object):
     Attributes:
         function (Callable): the visitor method
         skip (bool): if True, this method is not used as a visitor
+        types (tuple): types visited by this method (see
+                       :func:`Visitor.visits`)
 
     Args:
         function (Callable): the visitor method
         skip (bool): default False
+        types (tuple): default empty
 
     """
-    def __init__(self, function, skip=False):
+    def __init__(self, function, skip=False, types=()):
         self.function = function
-        # skip is currently not used, but I can't resist
         self.skip = skip
+        self.types = types
+
+
+class _MultiMethod(object):
+    """a visitor method dispatched on the types of its first arguments
+
+    Created by :func:`Visitor.multimethod`.  Implementations are registered
+    for a tuple of types, all of the same length.  A call is handled by the
+    implementation whose types match the types of the first arguments most
+    closely: each candidate is ranked by the position of its types in the
+    MROs of the argument types, and the lowest rank, compared from the first
+    argument to the last, wins.  Ties go to the earliest registration.
+    Choices are cached per tuple of argument types.
+
+    Attributes:
+        arity (int): number of arguments dispatched on
+
+    """
+    def __init__(self, types, function):
+        functools.update_wrapper(self, function)
+        self.arity = len(types)
+        self._implementations = []
+        self._cache = {}
+        self.register(*types)(function)
+
+    def register(self, *types):
+        """Decorator to register an implementation for `types`.
+
+        Returns the multimethod itself, so implementations may share its
+        name.  Stacked decorators register the same implementation for each
+        tuple of types.
+
+        Raises:
+            ValueError: if the number of types differs from `arity`
+
+        """
+        if len(types) != self.arity:
+            raise ValueError('Expected {0} types, got {1}'.format(
+                self.arity, len(types)))
+
+        def decorator(function):
+            if function is self:
+                function = self._implementations[-1][1]
+            self._implementations.append((types, function))
+            self._cache.clear()
+            return self
+        return decorator
+
+    def __call__(self, visitor, *args, **kwargs):
+        key = tuple(type(i) for i in args[:self.arity])
+        try:
+            function = self._cache[key]
+        except KeyError:
+            function = self._cache[key] = self._select(key)
+        return function(visitor, *args, **kwargs)
+
+    def _select(self, key):
+        best = None
+        for signature, function in self._implementations:
+            rank = _mro_rank(key, signature)
+            if rank is not None and (best is None or rank < best[0]):
+                best = rank, function
+        if best is None:
+            raise TypeError('{0} has no implementation for {1}'.format(
+                self.__name__, ', '.join(i.__name__ for i in key)))
+        return best[1]
+
+
+def _mro_rank(key, types):
+    """rank how closely `types` match the classes in `key`
+
+    Returns:
+        a tuple of MRO positions, or None if `types` does not match
+
+    """
+    rank = []
+    for cls, expected in zip(key, types):
+        mro = cls.__mro__
+        if expected in mro:
+            rank.append(mro.index(expected))
+        elif issubclass(cls, expected):
+            # virtual subclass; rank after all real bases
+            rank.append(len(mro))
+        else:
+            return None
+    return tuple(rank)
+
+
+class _VisitorDescriptor(object):
+    """descriptor binding a visitor method to its visitor
+
+    The bound method is built on first access and stored in the visitor's
+    instance dictionary, which shadows this descriptor on later lookups.  If
+    the visitor does not override :func:`Visitor._visit_wrapper`, the bound
+    method calls the function directly.
+
+    Attributes:
+        function (Callable): the unwrapped visitor method
+        name (str): the attribute name of the visitor method
+
+    """
+    def __init__(self, function, name):
+        functools.update_wrapper(self, function)
+        self.function = function
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        bound = self.bind(instance)
+        try:
+            instance.__dict__[self.name] = bound
+        except AttributeError:
+            # visitor has no instance dictionary; bind on each access
+            pass
+        return bound
+
+    def bind(self, instance):
+        """create the visitor method bound to `instance`"""
+        return type(instance)._get_binder()(instance, self.function)
+
+
+def _unwrapped(method):
+    """the function of a visitor method, or None if not a visitor method"""
+    if isinstance(method, _VisitorDescriptor):
+        return method.function
+    return None
+
+
+def _owner(cls, name):
+    """the class in the MRO of `cls` that defines the attribute `name`"""
+    for klass in cls.__mro__:
+        if name in vars(klass):
+            return klass
+    return None
+
+
+def _overrides(cls, name, base):
+    """whether `cls` overrides the attribute `name` defined by `base`"""
+    owner = _owner(cls, name)
+    return owner is not None and owner is not base
+
+
+def _cached_bindings(visitor):
+    """names of the methods bound to `visitor` and cached in its instance
+    dictionary"""
+    cls = type(visitor)
+    return [name for name in vars(visitor)
+            if isinstance(getattr(cls, name, None),
+                          (_VisitorDescriptor, _Attribute))]
 
 
 class _MetaVisitor(type):
     def __init__(cls, name, bases, attrs):
+        # visited type -> visitor method name, for this class only
+        cls._type_handlers = {}
         for k, v in attrs.items():
             if isinstance(v, _VisitorMethod):
+                cls._type_handlers.update((i, k) for i in v.types)
                 v = v.function
-            elif k.startswith('visit_'):
+            elif (k.startswith('visit_') or k == 'generic_visit' or
+                  isinstance(v, _MultiMethod)):
                 v = cls.visitor_method(v).function
+            if isinstance(v, _VisitorDescriptor):
+                v = _VisitorDescriptor(v.function, k)
             attrs[k] = v
             setattr(cls, k, v)
+        # visitee type -> unwrapped visitor method, filled on first use
+        cls._dispatch_table = {}
+        # visitee type, or (visitee type, missing visitor method name) ->
+        # visitor method name, filled on first use
+        cls._resolved = {}
+        # value of kind_key -> unwrapped visitor method, filled on first use
+        cls._kind_table = {}
+        # visitee type -> (unwrapped visitor method, name) for
+        # BatchingVisitor, for types not visited by kind; filled on first use
+        cls._group_table = {}
+        cls._instances = weakref.WeakSet()
+        # see Visitor._get_binder
+        cls._binder = None
         super(_MetaVisitor, cls).__init__(name, bases, attrs)
 
 
@@ -273,138 +945,2639 @@ class Visitor(_six.with_metaclass(_MetaVisitor, object)):
     This implementation does nothing special, but provides groundwork for
     child classes.
 
+    A visitee is visited by the visitor method its `accept` method calls.
+    :func:`dispatch` can also visit objects without an `accept` method, using
+    methods registered for their type with :func:`visits`.  When there is no
+    method for a type, :func:`dispatch` uses the method for its nearest
+    ancestor, in MRO order, or else `generic_visit` if defined.  So do the
+    accept methods created by :func:`Visitee.create` and
+    :func:`Visitee.auto_create`, when the method they call is missing:
+
+    >>> class Animal(object):
+    ...     pass
+    >>> class Dog(Animal):
+    ...     pass
+    >>> class MyVisitor(Visitor):
+    ...     @Visitor.visits(Animal)
+    ...     def animal(self, subject):
+    ...         return 'animal'
+    ...     def generic_visit(self, subject):
+    ...         return 'other'
+    >>> MyVisitor().dispatch(Dog())
+    'animal'
+    >>> MyVisitor().dispatch(1)
+    'other'
+
+    Objects that are plain data, such as decoded JSON, can instead be visited
+    by the value of an item.  Set `kind_key` to a key or index; instances of
+    `kind_types` are then visited by the method `visit_<subject[kind_key]>`,
+    or `generic_visit`:
+
+    >>> class JSONVisitor(Visitor):
+    ...     kind_key = 'kind'
+    ...     def visit_leaf(self, subject):
+    ...         return subject['value']
+    >>> JSONVisitor().dispatch({'kind': 'leaf', 'value': 1})
+    1
+
+    Visitors that traverse visitees find their children with
+    :func:`_gather_children`.  Objects visited by kind have the children
+    `subject[children_key]`, or none if `children_key` is None or the item
+    is missing.
+
     Attributes:
-        _visiting (bool): whether this is currently visiting a visitee
+        kind_key: key or index of the kind of plain data objects, or None
+        kind_types (tuple): types visited by kind when `kind_key` is set
+        children_key: key, index or slice of the children of objects visited
+                      by kind
+        _visiting (bool): whether this is currently visiting a visitee, for
+                          visitors that need to know; specialized
+                          :class:`WrappingVisitor` subclasses that override
+                          neither all-hook leave it False
+        _handlers (dict): bound visitor methods, keyed by visitee type
+        _kinds (dict): bound visitor methods, keyed by kind
 
     """
+    kind_key = None
+    kind_types = (dict, list, tuple)
+    children_key = None
+
+    # caches of bound visitor methods, see _new_caches
+    _caches = ('_handlers', '_kinds')
+
     def __init__(self, *args, **kwargs):
         super(Visitor, self).__init__(*args, **kwargs)
         self._visiting = False
+        self._new_caches()
 
-    @classmethod
-    def visitor_method(cls, func):
-        """Wrapper to mark non-default method as a visitor method.
+    def _new_caches(self):
+        """Create empty caches of bound visitor methods.
 
-        >>> class MyClass(Visitor):
-        ...    @Visitor.visitor_method
-        ...    def unusual_method_name(self, subject):
-        ...        pass
+        The visitor is also registered with its class, so that
+        :func:`_invalidate` can clear them.
 
         """
-        # wrap func with _visit_wrapper
-        wrapper = _six.partialmethod(cls._visit_wrapper, function=func)
-        wrapper = functools.wraps(func)(wrapper)
-        # mark as a visitor method
-        return _VisitorMethod(wrapper)
+        self._handlers = {}
+        self._kinds = {}
+        type(self)._instances.add(self)
 
-    @classmethod
-    def non_visitor_method(cls, func):
-        """Wrapper to mark method as *not* a visitor method.
+    def __getstate__(self):
+        """Get the state to copy or pickle.
 
-        >>> class MyClass(Visitor):
-        ...    @Visitor.non_visitor_method
-        ...    def visit_DontUseThisMethod(self, subject):
-        ...        pass
+        Bound visitor methods refer to this visitor, so they are left out,
+        as are the caches that hold them; a copy binds its own.
 
         """
-        return _VisitorMethod(func, skip=True)
+        state = dict(vars(self))
+        for name in _cached_bindings(self) + list(self._caches):
+            state.pop(name, None)
+        return state
 
-    def _visit_wrapper(self, *args, **kwargs):
-        """Wrapper for visitor methods.
+    def __setstate__(self, state):
+        vars(self).update(state)
+        self._new_caches()
 
-        This method wraps all visitor methods.  This is intended to be
-        overridden, and need not be called when overridden.  The wrapped
-        method is always passed in as a keyword argument `function`.  This
-        must pass all other positional and keyword arguments to that function.
+    def dispatch(self, subject, *args):
+        """Visit a visitee.
 
-        Args:
-            function: the function to wrap; always passed as keyword argument
+        Equivalent to `subject.accept(self, *args)`, but the visitor method
+        is looked up once per visitee type instead of on every call.
+
+        >>> @Visitee.create
+        ... class Leaf:
+        ...     pass
+        >>> class MyVisitor(Visitor):
+        ...     def visit_Leaf(self, subject):
+        ...         return 'leaf'
+        >>> MyVisitor().dispatch(Leaf())
+        'leaf'
+
+        Raises:
+            AttributeError: if this visitor has no method for the visitee,
+                            its ancestors or `generic_visit`
 
         """
-        return kwargs.pop('function')(self, *args, **kwargs)
+        try:
+            handler = self._handlers[type(subject)]
+        except KeyError:
+            handler = self._bind_handler(subject)
+        return handler(subject, *args)
 
+    def _dispatch_child(self, subject):
+        """Visit a child visitee, passing no further arguments.
 
-class WrappingVisitor(Visitor):
-    """A visitor class that wraps each call with pre and post methods.
+        Equivalent to :func:`dispatch`, which is slower with a variable
+        number of arguments.
 
-    """
-    def _visit_wrapper(self, *args, **kwargs):
-        func = kwargs['function']
-        if self._visiting:
-            pre = self._wrap_each_pre
-            post = self._wrap_each_post
-            return post(func(self, *pre(*args)))
+        """
+        try:
+            handler = self._handlers[type(subject)]
+        except KeyError:
+            handler = self._bind_handler(subject)
+        return handler(subject)
+
+    def _bind_handler(self, subject):
+        """Find and cache the bound visitor method for a visitee type."""
+        cls = type(subject)
+        try:
+            return self._handlers[cls]
+        except KeyError:
+            pass
+        name = type(self)._resolve(subject)
+        if name is None:
+            handler = functools.partial(_accept, self)
         else:
-            self._visiting = True
-            pre = self._wrap_all_pre
-            post = self._wrap_all_post
-            try:
-                return post(self._visit_wrapper(*pre(*args), **kwargs))
-            finally:
-                self._visiting = False
+            handler = getattr(self, name)
+        self._handlers[cls] = handler
+        return handler
 
-    def _wrap_each_pre(self, *args):
-        """Method called before each visit.
+    @classmethod
+    def _visit_function(cls, subject):
+        """Find the unwrapped visitor method for a visitee.
+
+        Results are cached per visitee type in the class dispatch table.
 
         Returns:
-            all arguments to be passed to visitor method
+            the visitor function, or None if the visitee must be visited
+            through :func:`dispatch`
 
         """
-        return args
+        try:
+            function = cls._dispatch_table[type(subject)]
+        except KeyError:
+            try:
+                name = cls._resolve(subject)
+            except AttributeError:
+                name = None
+            function = _unwrapped(getattr(cls, name, None) if name else None)
+            cls._dispatch_table[type(subject)] = function
+        if function is None and cls._by_kind(subject):
+            function = cls._kind_function(subject[cls.kind_key])
+        return function
 
-    def _wrap_each_post(self, arg):
-        """Method called after each visit.
+    @classmethod
+    def _by_kind(cls, subject):
+        """Whether `subject` is visited by the value of its `kind_key`."""
+        return cls.kind_key is not None and isinstance(subject, cls.kind_types)
 
-        Returns:
-            return value from each visitor method
+    @classmethod
+    def _kind_function(cls, kind):
+        """Find the unwrapped visitor method for a kind, cached per kind."""
+        try:
+            return cls._kind_table[kind]
+        except KeyError:
+            pass
+        method = getattr(cls, 'visit_' + str(kind), None)
+        if method is None:
+            method = getattr(cls, 'generic_visit', None)
+        function = cls._kind_table[kind] = _unwrapped(method)
+        return function
+
+    def _dispatch_kind(self, subject, *args):
+        """Visit `subject` by the value of its `kind_key`."""
+        kind = subject[self.kind_key]
+        try:
+            handler = self._kinds[kind]
+        except KeyError:
+            handler = self._bind_kind(kind)
+        return handler(subject, *args)
+
+    def _bind_kind(self, kind):
+        """Find and cache the bound visitor method for a kind."""
+        name = 'visit_' + str(kind)
+        if not hasattr(self, name):
+            if not hasattr(self, 'generic_visit'):
+                raise AttributeError('{0!r} object has no attribute '
+                                     '{1!r}'.format(type(self).__name__, name))
+            name = 'generic_visit'
+        handler = self._kinds[kind] = getattr(self, name)
+        return handler
+
+    def _gather_children(self, subject):
+        """Gather children from a visitee.
+
+        Default implementation simply returns `subject.children`, or the
+        `children_key` item of objects visited by kind.
 
         """
-        return arg
+        if self.kind_key is not None and isinstance(subject,
+                                                    self.kind_types):
+            if self.children_key is None:
+                return ()
+            try:
+                return subject[self.children_key]
+            except (KeyError, IndexError):
+                return ()
+        return subject.children
 
-    def _wrap_all_pre(self, *args):
-        """Method called before any visit method is called.
+    def walk(self, subject):
+        """Walk a visitee and its descendants, depth first.
 
-        This is the first method called when a visitor method is called.
+        Yields `(event, node, depth)` for each visitee, where `event` is
+        :data:`ENTER` before the visitee's children and :data:`LEAVE` after
+        them, and the root has depth 0.  No visitor methods are called.
 
-        Returns:
-            arguments passed to :func:`_wrap_each_pre`
+        Send :data:`SKIP` in reply to an :data:`ENTER` event to skip that
+        visitee's children; `send` then returns None, and the next event is
+        the visitee's :data:`LEAVE`:
+
+        >>> @Visitee.create
+        ... class Tree(object):
+        ...     def __init__(self, name, *children):
+        ...         self.name = name
+        ...         self.children = children
+        >>> tree = Tree('a', Tree('b', Tree('c')), Tree('d'))
+        >>> events = Visitor().walk(tree)
+        >>> for event, node, depth in events:
+        ...     print('{0} {1} {2}'.format(event, node.name, depth))
+        ...     if event is ENTER and node.name == 'b':
+        ...         _ = events.send(SKIP)
+        ENTER a 0
+        ENTER b 1
+        LEAVE b 1
+        ENTER d 1
+        LEAVE d 1
+        LEAVE a 0
 
         """
-        return args
+        gather = self._gather_children
+        stack = [(None, iter((subject,)))]
+        while stack:
+            node, children = stack[-1]
+            depth = len(stack) - 1
+            for child in children:
+                if (yield ENTER, child, depth) is SKIP:
+                    yield
+                    children = ()
+                else:
+                    children = gather(child)
+                stack.append((child, iter(children)))
+                break
+            else:
+                stack.pop()
+                if stack:
+                    yield LEAVE, node, depth - 1
 
-    def _wrap_all_post(self, arg):
-        """Method called after all visit methods are called.
+    def frontiers(self, subject, depth=None):
+        """Walk a visitee and its descendants, breadth first.
 
-        This is the last method called when a visitor method is called.
+        Yields the list of visitees at each level, starting with `[subject]`.
+        Only one level is held at a time.  No visitor methods are called.
 
-        Returns:
-            final return value from a visitor method call
+        Args:
+            subject: the root visitee
+            depth (int): the deepest level to yield, or None for all levels;
+                         the root is at depth 0
 
         """
-        return arg
+        gather = self._gather_children
+        frontier = [subject]
+        level = 0
+        while frontier:
+            yield frontier
+            if depth is not None and level >= depth:
+                return
+            frontier = [child for node in frontier for child in gather(node)]
+            level += 1
 
+    @classmethod
+    def _resolve(cls, subject):
+        """Find the name of the visitor method for a visitee.
 
-class CascadingVisitor(WrappingVisitor):
-    """Visits children first.
+        Methods registered for the visitee's type come first, then the method
+        called by its `accept` method, then :func:`_inherited_handler`.
+        Results are cached per visitee type.
 
-    This visitor visits all child nodes of a visitee first, cascading through
-    all children.
+        Returns:
+            the method name, or None if the visitee must be visited through
+            its `accept` method
 
-    Visitor methods are passed the visitee, then a list of return values from
-    visiting the children, then all remaining arguments.
+        Raises:
+            AttributeError: if there is no visitor method for the visitee
 
-    """
-    def _gather_children(self, subject):
-        """Gather children from a visitee.
+        """
+        node_type = type(subject)
+        try:
+            return cls._resolved[node_type]
+        except KeyError:
+            pass
+        name = cls._registered_handler(node_type)
+        if name is None and cls._by_kind(subject):
+            name = '_dispatch_kind'
+        opaque = False
+        if name is None and hasattr(node_type, 'accept'):
+            name = _accept_name(subject)
+            opaque = name is None
+        if not (opaque or hasattr(cls, name or '')):
+            name = cls._inherited_handler(node_type, name)
+        cls._resolved[node_type] = name
+        return name
 
-        Default implementation simply returns `subject.children`.
+    @classmethod
+    def _registered_handler(cls, node_type):
+        """Find the name of the method registered for exactly `node_type`."""
+        for klass in cls.__mro__:
+            name = vars(klass).get('_type_handlers', {}).get(node_type)
+            if name is not None:
+                return name
+        return None
 
-        """
-        return subject.children
+    def _inherited_method(self, node_type, missing):
+        """Find the bound visitor method for an ancestor type.
 
-    def _wrap_each_pre(self, subject, *args):
-        children = [c.accept(self) for c in self._gather_children(subject)]
-        args = list(args)
+        Used by accept methods created by :func:`Visitee.create` when this
+        visitor has no method named `missing`.  Results are cached per
+        visitee type and name.
+
+        Raises:
+            AttributeError: if no method is found
+
+        """
+        cls = type(self)
+        key = (node_type, missing)
+        try:
+            name = cls._resolved[key]
+        except KeyError:
+            name = cls._inherited_handler(node_type, missing)
+            cls._resolved[key] = name
+        return getattr(self, name)
+
+    @classmethod
+    def _inherited_handler(cls, node_type, missing=None):
+        """Find the name of the visitor method for an ancestor type.
+
+        Ancestors are searched in MRO order for a registered method or a
+        method named by an accept method created by :func:`Visitee.create`.
+        `generic_visit` is used if none is found.
+
+        Raises:
+            AttributeError: if no method is found
+
+        """
+        for ancestor in node_type.__mro__[1:]:
+            name = cls._registered_handler(ancestor)
+            accept = vars(ancestor).get('accept')
+            if name is None and getattr(accept, '_autocreate', None):
+                name = 'visit_' + accept._autocreate
+            if name is not None and hasattr(cls, name):
+                return name
+        if hasattr(cls, 'generic_visit'):
+            return 'generic_visit'
+        raise AttributeError('{0!r} object has no attribute {1!r}'.format(
+            cls.__name__, missing or 'generic_visit'))
+
+    @classmethod
+    def visits(cls, *types):
+        """Wrapper to mark a method as the visitor method for types.
+
+        Objects of these types, or of subclasses without a visitor method of
+        their own, are visited by the method through :func:`dispatch`.  The
+        types need not be visitees.
+
+        >>> class MyClass(Visitor):
+        ...    @Visitor.visits(int, float)
+        ...    def number(self, subject):
+        ...        return subject
+        >>> MyClass().dispatch(1)
+        1
+
+        """
+        def decorator(func):
+            wrapper = _VisitorDescriptor(func, func.__name__)
+            return _VisitorMethod(wrapper, types=types)
+        return decorator
+
+    @classmethod
+    def register_type(cls, node_type, func):
+        """Register a visitor method for a type after class creation.
+
+        The function is set on this class as a visitor method named by its
+        `__name__`, and cached method lookups of this class, its subclasses
+        and their instances are cleared.
+
+        """
+        name = func.__name__
+        setattr(cls, name, _VisitorDescriptor(func, name))
+        cls._type_handlers[node_type] = name
+        cls._invalidate(name)
+
+    @classmethod
+    def _invalidate(cls, name=None):
+        """Clear cached method lookups of this class and its subclasses.
+
+        Args:
+            name (str): also clear bound methods cached under this name
+
+        """
+        pending = [cls]
+        while pending:
+            klass = pending.pop()
+            pending.extend(klass.__subclasses__())
+            klass._dispatch_table.clear()
+            klass._resolved.clear()
+            klass._kind_table.clear()
+            klass._group_table.clear()
+            for instance in klass._instances:
+                instance._handlers.clear()
+                instance._kinds.clear()
+                vars(instance).pop(name, None)
+
+    @classmethod
+    def visitor_method(cls, func):
+        """Wrapper to mark non-default method as a visitor method.
+
+        >>> class MyClass(Visitor):
+        ...    @Visitor.visitor_method
+        ...    def unusual_method_name(self, subject):
+        ...        pass
+
+        """
+        # wrap func with _visit_wrapper when bound
+        wrapper = _VisitorDescriptor(func, func.__name__)
+        # mark as a visitor method
+        return _VisitorMethod(wrapper)
+
+    @classmethod
+    def multimethod(cls, *types):
+        """Wrapper to create a visitor method dispatched on argument types.
+
+        The decorated function handles calls whose first arguments are
+        instances of `types`.  Register implementations for other types with
+        the `register` method of the result:
+
+        >>> class Promote(Visitor):
+        ...    @Visitor.multimethod(int, int)
+        ...    def visit_Add(self, left, right):
+        ...        return 'int'
+        ...    @visit_Add.register(int, float)
+        ...    @visit_Add.register(float, int)
+        ...    def visit_Add(self, left, right):
+        ...        return 'float'
+        >>> Promote().visit_Add(1, 2.0)
+        'float'
+
+        See :class:`_MultiMethod` for how implementations are chosen.
+
+        """
+        return functools.partial(_MultiMethod, types)
+
+    @classmethod
+    def non_visitor_method(cls, func):
+        """Wrapper to mark method as *not* a visitor method.
+
+        >>> class MyClass(Visitor):
+        ...    @Visitor.non_visitor_method
+        ...    def visit_DontUseThisMethod(self, subject):
+        ...        pass
+
+        """
+        return _VisitorMethod(func, skip=True)
+
+    def _visit_wrapper(self, *args, **kwargs):
+        """Wrapper for visitor methods.
+
+        This method wraps all visitor methods.  This is intended to be
+        overridden, and need not be called when overridden.  The wrapped
+        method is always passed in as a keyword argument `function`.  This
+        must pass all other positional and keyword arguments to that function.
+
+        If this method is not overridden, visitor methods are called directly
+        and this method is not called at all.
+
+        Args:
+            function: the function to wrap; always passed as keyword argument
+
+        """
+        return kwargs.pop('function')(self, *args, **kwargs)
+
+    @classmethod
+    def _get_binder(cls):
+        """Get the function that binds visitor methods to instances.
+
+        The binder is created by :func:`_make_binder` once per class.
+
+        """
+        binder = cls._binder
+        if binder is None:
+            binder = cls._binder = cls._make_binder()
+        return binder
+
+    @classmethod
+    def _make_binder(cls):
+        """Create the function that binds visitor methods to instances.
+
+        The binder is called as `binder(instance, function)` and returns the
+        visitor method `function` bound to `instance`.  By default, visitor
+        methods are called through :func:`_visit_wrapper` only if it is
+        overridden.  If it was made by :func:`_engine_wrapper`, visitor
+        methods call its engine method directly instead.
+
+        """
+        engine = getattr(cls._visit_wrapper, '_engine', None)
+        if engine is not None:
+            return functools.partial(_bind_engine, engine)
+        if _overrides(cls, '_visit_wrapper', Visitor):
+            return _bind_wrapper
+        return _bind_direct
+
+
+def _bind_direct(instance, function):
+    """bind a visitor method to call it without a wrapper"""
+    return types.MethodType(function, instance)
+
+
+def _bind_wrapper(instance, function):
+    """bind a visitor method through `instance._visit_wrapper`"""
+    return functools.partial(instance._visit_wrapper, function=function)
+
+
+def _bind_engine(engine, instance, function):
+    """bind a visitor method to the engine method named `engine`"""
+    return functools.partial(getattr(instance, engine), function)
+
+
+def _engine_wrapper(engine):
+    """create the `_visit_wrapper` of a visitor whose visits are run by its
+    method named `engine`
+
+    The engine method is passed the unwrapped visitor method, then the
+    arguments of the call.  Visitor methods are bound to the engine method
+    by :func:`_bind_engine`, so the wrapper is only called if a subclass
+    overrides it.
+
+    """
+    def _visit_wrapper(self, *args, **kwargs):
+        return getattr(self, engine)(kwargs.pop('function'), *args, **kwargs)
+
+    _visit_wrapper._engine = engine
+    return _visit_wrapper
+
+
+def _specializable(wrapper):
+    """mark a `_visit_wrapper` whose behaviour the binders of
+    :class:`WrappingVisitor` reproduce
+
+    Classes that inherit a marked wrapper have their visitor methods bound
+    to specialized functions, which do not call the wrapper.  Overriding
+    the wrapper again, even to call it, restores the generic binding.
+
+    """
+    wrapper._specializable = True
+    return wrapper
+
+
+class WrappingVisitor(Visitor):
+    """A visitor class that wraps each call with pre and post methods.
+
+    Unless a subclass overrides :func:`_visit_wrapper`, each subclass is
+    given a wrapper specialized for the hooks it overrides; hooks that are
+    not overridden are identities, and are not called.  If neither
+    :func:`_wrap_all_pre` nor :func:`_wrap_all_post` is overridden, outermost
+    calls are the same as nested calls, and `_visiting` stays False while
+    visiting; the generic wrapper sets it during outermost calls.
+
+    """
+    @classmethod
+    def _make_binder(cls):
+        if not getattr(cls._visit_wrapper, '_specializable', False):
+            return super(WrappingVisitor, cls)._make_binder()
+        nested = cls._nested_binder()
+        all_pre = _overrides(cls, '_wrap_all_pre', WrappingVisitor)
+        all_post = _overrides(cls, '_wrap_all_post', WrappingVisitor)
+        if not (all_pre or all_post):
+            # outermost calls are the same as nested calls
+            return nested
+        return functools.partial(_bind_outer, nested, all_pre, all_post)
+
+    @classmethod
+    def _nested_binder(cls):
+        """Create the binder for calls made while visiting.
+
+        Nested calls are wrapped by :func:`_wrap_each_pre` and
+        :func:`_wrap_each_post`, where overridden.
+
+        """
+        key = (_overrides(cls, '_wrap_each_pre', WrappingVisitor),
+               _overrides(cls, '_wrap_each_post', WrappingVisitor))
+        return _nested_binders[key]
+
+    @_specializable
+    def _visit_wrapper(self, *args, **kwargs):
+        func = kwargs['function']
+        if self._visiting:
+            pre = self._wrap_each_pre
+            post = self._wrap_each_post
+            return post(func(self, *pre(*args)))
+        else:
+            self._visiting = True
+            pre = self._wrap_all_pre
+            post = self._wrap_all_post
+            try:
+                return post(self._visit_wrapper(*pre(*args), **kwargs))
+            finally:
+                self._visiting = False
+
+    def _wrap_each_pre(self, *args):
+        """Method called before each visit.
+
+        Returns:
+            all arguments to be passed to visitor method
+
+        """
+        return args
+
+    def _wrap_each_post(self, arg):
+        """Method called after each visit.
+
+        Returns:
+            return value from each visitor method
+
+        """
+        return arg
+
+    def _wrap_all_pre(self, *args):
+        """Method called before any visit method is called.
+
+        This is the first method called when a visitor method is called.
+
+        Returns:
+            arguments passed to :func:`_wrap_each_pre`
+
+        """
+        return args
+
+    def _wrap_all_post(self, arg):
+        """Method called after all visit methods are called.
+
+        This is the last method called when a visitor method is called.
+
+        Returns:
+            final return value from a visitor method call
+
+        """
+        return arg
+
+
+def _bind_outer(nested_binder, all_pre, all_post, instance, function):
+    """bind a visitor method of a specialized :class:`WrappingVisitor`
+
+    Args:
+        nested_binder (Callable): binder for nested calls
+        all_pre (bool): whether to call `_wrap_all_pre`
+        all_post (bool): whether to call `_wrap_all_post`
+
+    """
+    nested = nested_binder(instance, function)
+    pre = instance._wrap_all_pre if all_pre else None
+    post = instance._wrap_all_post if all_post else None
+
+    def call(*args):
+        if instance._visiting:
+            return nested(*args)
+        instance._visiting = True
+        try:
+            if pre is not None:
+                args = pre(*args)
+            result = nested(*args)
+            return result if post is None else post(result)
+        finally:
+            instance._visiting = False
+    return call
+
+
+def _bind_each_pre(instance, function):
+    pre = instance._wrap_each_pre
+
+    def call(*args):
+        return function(instance, *pre(*args))
+    return call
+
+
+def _bind_each_post(instance, function):
+    post = instance._wrap_each_post
+
+    def call(*args):
+        return post(function(instance, *args))
+    return call
+
+
+def _bind_each_pre_post(instance, function):
+    pre = instance._wrap_each_pre
+    post = instance._wrap_each_post
+
+    def call(*args):
+        return post(function(instance, *pre(*args)))
+    return call
+
+
+# (each pre overridden, each post overridden) -> binder for nested calls
+_nested_binders = {
+    (False, False): _bind_direct,
+    (True, False): _bind_each_pre,
+    (False, True): _bind_each_post,
+    (True, True): _bind_each_pre_post,
+}
+
+
+class Estimate(collections.namedtuple('Estimate', 'value error low high')):
+    """An estimate with a confidence interval.
+
+    Attributes:
+        value: the estimate
+        error: the standard error of the estimate
+        low: the lower end of the confidence interval
+        high: the upper end of the confidence interval
+
+    """
+    __slots__ = ()
+
+
+class CascadingVisitor(WrappingVisitor):
+    """Visits children first.
+
+    This visitor visits all child nodes of a visitee first, cascading through
+    all children.
+
+    Visitor methods are passed the visitee, then a list of return values from
+    visiting the children, then all remaining arguments.
+
+    By default, each child is visited by a recursive call to
+    :func:`Visitor.dispatch`.  Set `iterative` to True in a subclass to
+    instead traverse with an explicit stack; visitor methods are called with
+    the same arguments, but trees of any depth may be visited.  The iterative
+    traversal calls :func:`_gather_children` and :func:`_wrap_each_post`, but
+    not :func:`_wrap_each_pre`, for each node, so subclasses that override
+    :func:`_wrap_each_pre` are always visited recursively, through it.
+
+    Set `memoize` to True to visit each distinct visitee (by identity) only
+    once per traversal, which is useful when visitees are shared, as in a
+    directed acyclic graph.  A result is kept only until every parent that
+    refers to the visitee has received it.  Memoizing implies the iterative
+    traversal.
+
+    Set `lazy` to True to instead pass visitor methods an iterator over the
+    return values from visiting the children.  Each child is visited only
+    when the iterator reaches it, and its result is not kept, so visitor
+    methods can short-circuit, or stream over many children.  The iterator
+    has a `skip` method to pass over children without visiting them:
+
+    >>> @Visitee.create
+    ... class If(object):
+    ...     def __init__(self, *children):
+    ...         self.children = children
+    >>> @Visitee.create
+    ... class Const(object):
+    ...     children = ()
+    ...     def __init__(self, value):
+    ...         self.value = value
+    >>> class Evaluate(CascadingVisitor):
+    ...     lazy = True
+    ...     def visit_If(self, subject, children):
+    ...         if not next(children):
+    ...             children.skip()
+    ...         return next(children)
+    ...     def visit_Const(self, subject, children):
+    ...         return subject.value
+    >>> Evaluate().dispatch(If(Const(True), Const('then'), If()))
+    'then'
+
+    Lazy visits are recursive; `lazy` overrides `iterative` and `memoize`.
+
+    Override :func:`_pre_visit` to skip visitees or stop visiting early.
+    Pruning implies the iterative traversal, without memoizing, and
+    overrides `lazy`; it cannot be combined with an override of
+    :func:`_wrap_each_pre`.
+
+    Children are found by :func:`Visitor._gather_children`.
+
+    These options are best set on a subclass, whose visitor methods are then
+    specialized for them.  They may also be set on an instance, at any time,
+    at the cost of the specialization.
+
+    Attributes:
+        iterative (bool): whether to traverse with an explicit stack
+        memoize (bool): whether to visit shared visitees only once
+        lazy (bool): whether to visit children as their results are needed
+
+    """
+    iterative = False
+    memoize = False
+    lazy = False
+    # options that select how visitor methods are bound
+    _options = ('iterative', 'memoize', 'lazy')
+    # whether a pruned traversal is running, and the result it stopped with
+    _pruning = False
+    _stop = None
+
+    def _wrap_each_pre(self, subject, *args):
+        dispatch = self._dispatch_child
+        if self.lazy:
+            children = _ChildResults(dispatch, self._gather_children(subject))
+        else:
+            children = [dispatch(c) for c in self._gather_children(subject)]
+        args = list(args)
         args.insert(0, children)
         args.insert(0, subject)
         return args
+
+    def _pre_visit(self, subject):
+        """Method called before visiting each visitee or its children.
+
+        Return `(SKIP, value)` to use `value` as the result of `subject`
+        without visiting it or its children, or `(STOP, value)` to stop
+        visiting and return `value` from the outermost visitor method call.
+        Return None to visit `subject` as usual.
+
+        >>> @Visitee.create
+        ... class Node(object):
+        ...     def __init__(self, valid, *children):
+        ...         self.valid = valid
+        ...         self.children = children
+        >>> class FirstInvalid(CascadingVisitor):
+        ...     def _pre_visit(self, subject):
+        ...         if not subject.valid:
+        ...             return STOP, subject
+        ...     def visit_Node(self, subject, children):
+        ...         return None
+        >>> bad = Node(False)
+        >>> FirstInvalid().dispatch(Node(True, Node(True), bad)) is bad
+        True
+
+        """
+        return None
+
+    @classmethod
+    def _prunes(cls):
+        """Whether this visitor overrides :func:`_pre_visit`.
+
+        Raises:
+            TypeError: if it also overrides :func:`_wrap_each_pre`, which
+                       pruned traversals do not call
+
+        """
+        if not _overrides(cls, '_pre_visit', CascadingVisitor):
+            return False
+        if cls._wraps_each_pre():
+            raise TypeError('{0} overrides both _pre_visit and '
+                            '_wrap_each_pre'.format(cls.__name__))
+        return True
+
+    @classmethod
+    def _wraps_each_pre(cls):
+        """Whether this visitor overrides :func:`_wrap_each_pre`, and so
+        visits children recursively, through it."""
+        return _owner(cls, '_wrap_each_pre') is not CascadingVisitor
+
+    @classmethod
+    def _iterates(cls, visitor=None):
+        """Whether `visitor`, by default this class, visits children with
+        :func:`_cascade`."""
+        if visitor is None:
+            visitor = cls
+        if cls._wraps_each_pre():
+            return False
+        return (visitor.iterative or visitor.memoize) and not visitor.lazy
+
+    def __setattr__(self, name, value):
+        super(CascadingVisitor, self).__setattr__(name, value)
+        if name in self._options:
+            self._unbind()
+
+    def _unbind(self):
+        """Discard the visitor methods bound to this visitor.
+
+        They are bound again on next use, for the current options.
+
+        """
+        attrs = vars(self)
+        for name in _cached_bindings(self):
+            del attrs[name]
+        for cache in self._caches:
+            attrs.get(cache, {}).clear()
+
+    @classmethod
+    def _make_binder(cls):
+        binder = super(CascadingVisitor, cls)._make_binder()
+        return functools.partial(_bind_options, binder, cls._options)
+
+    @classmethod
+    def _nested_binder(cls):
+        if cls._prunes():
+            return _bind_pruned
+        if cls._iterates():
+            return _bind_cascade
+        if cls._wraps_each_pre():
+            return super(CascadingVisitor, cls)._nested_binder()
+        post = _overrides(cls, '_wrap_each_post', WrappingVisitor)
+        if cls.lazy:
+            return _bind_lazy_post if post else _bind_lazy
+        return _bind_children_post if post else _bind_children
+
+    @_specializable
+    def _visit_wrapper(self, *args, **kwargs):
+        if self._visiting and type(self)._prunes():
+            return self._cascade_pruned(kwargs['function'], *args)
+        if self._visiting and type(self)._iterates(self):
+            return self._cascade(kwargs['function'], *args)
+        return super(CascadingVisitor, self)._visit_wrapper(*args, **kwargs)
+
+    def estimate(self, subject, samples=100, seed=None, z=1.96):
+        """Estimate the result of visiting `subject` by sampling.
+
+        Estimates the result of visitors whose results are numbers, each the
+        sum of a visitee's own value and its children's results, such as
+        counts or sums, without visiting every visitee.  Each sample follows
+        one random path from `subject` to a leaf, calling the visitor method
+        of each visitee on the path with no children results to get its own
+        value (Knuth's random probe estimate).  The mean of the samples is an
+        unbiased estimate of the result:
+
+        >>> @Visitee.create
+        ... class Node(object):
+        ...     def __init__(self, *children):
+        ...         self.children = children
+        >>> class Count(CascadingVisitor):
+        ...     def visit_Node(self, subject, children):
+        ...         return 1 + sum(children)
+        >>> tree = Node(Node(Node(), Node()), Node(Node(), Node()))
+        >>> Count().estimate(tree, samples=10, seed=0).value
+        7.0
+
+        Visitees without a visitor method of their own, whose `accept` method
+        must be called, are visited in full when a sample reaches them.
+        Hooks such as :func:`_wrap_each_post` are not called.
+
+        Args:
+            subject: the root visitee
+            samples (int): the number of random paths to sample
+            seed: the seed for the random choice of paths, for reproducible
+                  estimates
+            z (float): the width of the confidence interval, in standard
+                       errors on each side; 1.96 gives about 95%
+
+        Returns:
+            Estimate: the estimate, with its confidence interval
+
+        Raises:
+            ValueError: if `samples` is less than 1
+
+        """
+        if samples < 1:
+            raise ValueError('Expected at least 1 sample, got {0}'.format(
+                samples))
+        choose = random.Random(seed).randrange
+        values = [self._probe(subject, choose) for i in range(samples)]
+        mean = float(sum(values)) / samples
+        if samples > 1:
+            variance = sum((v - mean) ** 2 for v in values) / (samples - 1)
+            error = math.sqrt(variance / samples)
+        else:
+            error = float('inf')
+        return Estimate(mean, error, mean - z * error, mean + z * error)
+
+    def _probe(self, subject, choose):
+        """Sample one random path from `subject` to a leaf.
+
+        Returns:
+            the sum of the value of each visitee on the path, weighted by the
+            number of visitees it stands for
+
+        """
+        gather = self._gather_children
+        resolve = self._visit_function
+        total = 0
+        weight = 1
+        while True:
+            function = resolve(subject)
+            if function is None:
+                return total + weight * self.dispatch(subject)
+            total += weight * function(self, subject, [])
+            children = gather(subject)
+            if not isinstance(children, (list, tuple)):
+                children = list(children)
+            if not children:
+                return total
+            weight *= len(children)
+            subject = children[choose(len(children))]
+
+    def _cascade(self, function, subject, *args):
+        """Visit `subject` and its children with an explicit stack.
+
+        Args:
+            function (Callable): the unwrapped visitor method for `subject`
+            subject: the visitee
+            args: additional arguments passed to `function`
+
+        """
+        if self.memoize:
+            return self._cascade_shared(function, subject, *args)
+        gather = self._gather_children
+        post = self._wrap_each_post
+        if not _overrides(type(self), '_wrap_each_post', WrappingVisitor):
+            post = None
+        lookup = type(self)._dispatch_table.get
+        resolve = self._visit_function
+        stack = [(function, subject, iter(gather(subject)), [], args)]
+        push = stack.append
+        while True:
+            function, subject, children, results, args = stack[-1]
+            for child in children:
+                child_function = lookup(type(child)) or resolve(child)
+                if child_function is None:
+                    results.append(self.dispatch(child))
+                    continue
+                grandchildren = gather(child)
+                if grandchildren:
+                    push((child_function, child, iter(grandchildren), [], ()))
+                    break
+                # visit leaves without pushing them
+                result = child_function(self, child, [])
+                results.append(result if post is None else post(result))
+            else:
+                stack.pop()
+                result = function(self, subject, results, *args)
+                if post is not None:
+                    result = post(result)
+                if not stack:
+                    return result
+                stack[-1][3].append(result)
+
+    def _cascade_shared(self, function, subject, *args):
+        """Visit `subject` and its children, visiting shared visitees once.
+
+        See :func:`_cascade`.
+
+        """
+        gather = self._gather_children
+        post = self._wrap_each_post
+        resolve = self._visit_function
+        counts = self._count_parents(subject)
+        memo = {}
+        stack = [(function, subject, iter(gather(subject)), [], args)]
+        while True:
+            function, subject, children, results, args = stack[-1]
+            for child in children:
+                key = id(child)
+                if key in memo:
+                    results.append(_consume(counts, memo, key, memo[key]))
+                    continue
+                child_function = resolve(child)
+                if child_function is None:
+                    result = _consume(counts, memo, key, self.dispatch(child))
+                    results.append(result)
+                    continue
+                stack.append((child_function, child,
+                              iter(gather(child)), [], ()))
+                break
+            else:
+                stack.pop()
+                result = post(function(self, subject, results, *args))
+                if not stack:
+                    return result
+                _consume(counts, memo, id(subject), result)
+                stack[-1][3].append(result)
+
+    def _cascade_pruned(self, function, subject, *args):
+        """Visit `subject` and its children, as decided by :func:`_pre_visit`.
+
+        See :func:`_cascade`.  Nested calls, made for visitees visited
+        through their `accept` method, stop the outermost call when they
+        stop.
+
+        """
+        nested = self._pruning
+        self._pruning = True
+        try:
+            value = self._prune(subject)
+            if self._stop is not None or value is not _not_pruned:
+                return value
+            return self._cascade_unpruned(function, subject, args)
+        finally:
+            if not nested:
+                self._pruning = False
+                self._stop = None
+
+    def _prune(self, subject):
+        """Call :func:`_pre_visit`, recording a request to stop.
+
+        Returns:
+            the value to use for `subject`, or `_not_pruned` to visit it
+
+        Raises:
+            ValueError: if :func:`_pre_visit` returns an invalid signal
+
+        """
+        decision = self._pre_visit(subject)
+        if decision is None:
+            return _not_pruned
+        signal, value = decision
+        if signal is STOP:
+            self._stop = (value,)
+        elif signal is not SKIP:
+            raise ValueError('invalid pruning signal {0!r}'.format(signal))
+        return value
+
+    def _cascade_unpruned(self, function, subject, args):
+        gather = self._gather_children
+        post = self._wrap_each_post
+        lookup = type(self)._dispatch_table.get
+        resolve = self._visit_function
+        prune = self._prune
+        stack = [(function, subject, iter(gather(subject)), [], args)]
+        while True:
+            function, subject, children, results, args = stack[-1]
+            for child in children:
+                child_function = lookup(type(child)) or resolve(child)
+                if child_function is None:
+                    # the nested call prunes the child
+                    result = self.dispatch(child)
+                else:
+                    result = prune(child)
+                    if result is _not_pruned:
+                        stack.append((child_function, child,
+                                      iter(gather(child)), [], ()))
+                        break
+                if self._stop is not None:
+                    return self._stop[0]
+                results.append(result)
+            else:
+                stack.pop()
+                result = post(function(self, subject, results, *args))
+                if not stack:
+                    return result
+                stack[-1][3].append(result)
+
+    def _count_parents(self, subject):
+        """Count the references to each distinct visitee below `subject`.
+
+        Returns:
+            dict: number of references, keyed by visitee id
+
+        """
+        gather = self._gather_children
+        resolve = self._visit_function
+        counts = {id(subject): 0}
+        pending = [subject]
+        while pending:
+            for child in gather(pending.pop()):
+                key = id(child)
+                if key in counts:
+                    counts[key] += 1
+                    continue
+                counts[key] = 1
+                if resolve(child) is not None:
+                    pending.append(child)
+        return counts
+
+
+def _consume(counts, memo, key, result):
+    """Hand a shared result to one parent.
+
+    The result is kept in `memo` while other parents still need it.  After
+    the last one, the result and its count are released.
+
+    """
+    count = counts[key] - 1
+    if count:
+        counts[key] = count
+        memo[key] = result
+    else:
+        del counts[key]
+        memo.pop(key, None)
+    return result
+
+
+def _bind_options(binder, options, instance, function):
+    """bind a visitor method of a :class:`CascadingVisitor`
+
+    Visitors that set any of `options` themselves are bound through
+    `_visit_wrapper`, which reads the options on each call.
+
+    Args:
+        binder (Callable): binder specialized for the class options
+        options (tuple): names of the options
+
+    """
+    attrs = getattr(instance, '__dict__', {})
+    if any(i in attrs for i in options):
+        return _bind_wrapper(instance, function)
+    return binder(instance, function)
+
+
+def _bind_cascade(instance, function):
+    """bind a visitor method of an iterative :class:`CascadingVisitor`"""
+    return functools.partial(instance._cascade, function)
+
+
+def _bind_pruned(instance, function):
+    """bind a visitor method of a :class:`CascadingVisitor` that prunes"""
+    return functools.partial(instance._cascade_pruned, function)
+
+
+def _bind_children(instance, function):
+    """bind a visitor method of a recursive :class:`CascadingVisitor`"""
+    handlers = instance._handlers
+    bind = instance._bind_handler
+    gather = instance._gather_children
+
+    def call(subject, *args):
+        children = [(handlers.get(type(c)) or bind(c))(c)
+                    for c in gather(subject)]
+        return function(instance, subject, children, *args)
+    return call
+
+
+def _bind_children_post(instance, function):
+    """bind a visitor method of a recursive :class:`CascadingVisitor` that
+    overrides `_wrap_each_post`"""
+    handlers = instance._handlers
+    bind = instance._bind_handler
+    gather = instance._gather_children
+    post = instance._wrap_each_post
+
+    def call(subject, *args):
+        children = [(handlers.get(type(c)) or bind(c))(c)
+                    for c in gather(subject)]
+        return post(function(instance, subject, children, *args))
+    return call
+
+
+def _bind_lazy(instance, function):
+    """bind a visitor method of a lazy :class:`CascadingVisitor`"""
+    dispatch = instance._dispatch_child
+    gather = instance._gather_children
+
+    def call(subject, *args):
+        children = _ChildResults(dispatch, gather(subject))
+        return function(instance, subject, children, *args)
+    return call
+
+
+def _bind_lazy_post(instance, function):
+    """bind a visitor method of a lazy :class:`CascadingVisitor` that
+    overrides `_wrap_each_post`"""
+    dispatch = instance._dispatch_child
+    gather = instance._gather_children
+    post = instance._wrap_each_post
+
+    def call(subject, *args):
+        children = _ChildResults(dispatch, gather(subject))
+        return post(function(instance, subject, children, *args))
+    return call
+
+
+class _ChildResults(object):
+    """An iterator over the results of visiting children, visiting each child
+    when its result is requested.
+
+    Results are not kept once returned.
+
+    """
+    __slots__ = ('_visit', '_children')
+
+    def __init__(self, visit, children):
+        self._visit = visit
+        self._children = iter(children)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self._visit(next(self._children))
+
+    next = __next__
+
+    def skip(self, count=1):
+        """Pass over the next `count` children without visiting them."""
+        for child in itertools.islice(self._children, count):
+            pass
+
+
+# returned by CascadingVisitor._prune for visitees that are not pruned
+_not_pruned = object()
+
+
+class FoldVisitor(CascadingVisitor):
+    """A cascading visitor whose children results are folded together.
+
+    The results of a visitee's children are combined by :func:`_combine`,
+    which subclasses must define and which must be associative, starting
+    from `identity`, which must be its identity.  Visitor methods are passed
+    the visitee and the combined result of its children, which is `identity`
+    if there are none, then all remaining arguments:
+
+    >>> @Visitee.create
+    ... class Node(object):
+    ...     def __init__(self, *children):
+    ...         self.children = children
+    >>> class Depth(FoldVisitor):
+    ...     identity = 0
+    ...     def _combine(self, left, right):
+    ...         return max(left, right)
+    ...     def visit_Node(self, subject, children):
+    ...         return children + 1
+    >>> Depth().dispatch(Node(Node(), Node(Node())))
+    3
+
+    Children results are combined in order, but not necessarily from left
+    to right.  Lists of more than `chunk_size` children are split into
+    chunks; each chunk is combined from left to right, and then the chunks
+    are combined in a balanced tree.  If `executor`, such as a
+    :class:`concurrent.futures.Executor`, is set, chunks are combined with
+    its `map` method, in parallel.  Only combining is parallel: visitor
+    methods are still called one at a time, by the calling thread.  A
+    process pool pickles the visitor for each chunk, without its kept
+    results or `executor`, so :func:`_combine` must not depend on changes
+    it makes to the visitor.
+
+    Set `incremental` to True to keep results between visits.  The result of
+    each visitee, and the combined result of each chunk of children, is
+    kept until :func:`clear_cache` is called, and reused whenever the same
+    visitee or chunk of visitees is visited again.  This suits persistent
+    trees, where changing a visitee replaces it and its ancestors, and the
+    unchanged subtrees are shared: only changed visitees, and chunks with
+    changed children, are visited and combined again.  Visitees must not
+    change once visited.
+
+    Folding visits are recursive; `iterative`, `memoize`, `lazy` and
+    :func:`CascadingVisitor._pre_visit` are not used.
+
+    Attributes:
+        identity: the identity of :func:`_combine`
+        chunk_size (int): the number of children results combined in order
+        executor: an executor combining chunks in parallel, or None
+        incremental (bool): whether to keep results between visits
+
+    """
+    identity = None
+    chunk_size = 256
+    executor = None
+    incremental = False
+    _options = ('incremental',)
+
+    def __init__(self, *args, **kwargs):
+        if _owner(type(self), '_combine') is FoldVisitor:
+            raise TypeError('{0} does not define _combine'.format(
+                type(self).__name__))
+        super(FoldVisitor, self).__init__(*args, **kwargs)
+        self.clear_cache()
+
+    def __getstate__(self):
+        """Get the state to copy or pickle.
+
+        Kept results and `executor` are left out too, so that a process pool
+        does not send them with every chunk.
+
+        """
+        state = super(FoldVisitor, self).__getstate__()
+        for name in ('_results', '_partials', 'executor'):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        super(FoldVisitor, self).__setstate__(state)
+        self.clear_cache()
+
+    def clear_cache(self):
+        """Discard the results kept by an incremental visitor."""
+        # visitee id -> (visitee, result)
+        self._results = {}
+        # ids of a chunk of visitees -> (visitees, combined result)
+        self._partials = {}
+
+    def _combine(self, left, right):
+        """Combine two results; must be associative.
+
+        Subclasses must define it; instantiating one that does not raises
+        TypeError.
+
+        """
+        raise NotImplementedError()
+
+    @classmethod
+    def _prunes(cls):
+        return False
+
+    @classmethod
+    def _iterates(cls, visitor=None):
+        return False
+
+    @_specializable
+    def _visit_wrapper(self, subject, *args, **kwargs):
+        wrapper = super(FoldVisitor, self)._visit_wrapper
+        if args or not self.incremental:
+            return wrapper(subject, *args, **kwargs)
+        key = id(subject)
+        try:
+            return self._results[key][1]
+        except KeyError:
+            pass
+        result = wrapper(subject, **kwargs)
+        self._results[key] = (subject, result)
+        return result
+
+    @classmethod
+    def _nested_binder(cls):
+        if _owner(cls, '_wrap_each_pre') is not FoldVisitor:
+            return super(FoldVisitor, cls)._nested_binder()
+        if cls.incremental:
+            return _bind_fold_incremental
+        return _bind_fold
+
+    def _wrap_each_pre(self, subject, *args):
+        args = list(args)
+        args.insert(0, self._fold(self._gather_children(subject)))
+        args.insert(0, subject)
+        return args
+
+    def _fold(self, children):
+        """Visit `children` and combine their results."""
+        if self.incremental:
+            return self._fold_incremental(list(children))
+        dispatch = self.dispatch
+        results = [dispatch(child) for child in children]
+        size = self.chunk_size
+        if len(results) <= size:
+            return self._reduce_chunk(results)
+        chunks = [results[i:i + size] for i in range(0, len(results), size)]
+        return _balanced(self._combine, self._reduce_chunks(chunks))
+
+    def _fold_incremental(self, children):
+        """Visit `children` and combine their results, reusing kept
+        results."""
+        size = self.chunk_size
+        partials = []
+        missing = []
+        for i in range(0, len(children), size):
+            chunk = children[i:i + size]
+            key = tuple(map(id, chunk))
+            try:
+                partials.append(self._partials[key][1])
+            except KeyError:
+                partials.append(None)
+                missing.append((len(partials) - 1, key, chunk))
+        dispatch = self.dispatch
+        results = [[dispatch(child) for child in chunk]
+                   for _, _, chunk in missing]
+        for (i, key, chunk), partial in zip(missing,
+                                            self._reduce_chunks(results)):
+            partials[i] = partial
+            self._partials[key] = (chunk, partial)
+        return _balanced(self._combine, partials, self.identity)
+
+    def _reduce_chunk(self, results):
+        """Combine `results` from left to right."""
+        return functools.reduce(self._combine, results, self.identity)
+
+    def _reduce_chunks(self, chunks):
+        """Combine the results of each chunk, with `executor` if set."""
+        if self.executor is not None and len(chunks) > 1:
+            return list(self.executor.map(self._reduce_chunk, chunks))
+        return [self._reduce_chunk(chunk) for chunk in chunks]
+
+
+def _bind_fold(instance, function):
+    """bind a visitor method of a :class:`FoldVisitor`"""
+    gather = instance._gather_children
+    fold = instance._fold
+    post = None
+    if _overrides(type(instance), '_wrap_each_post', WrappingVisitor):
+        post = instance._wrap_each_post
+
+    def call(subject, *args):
+        result = function(instance, subject, fold(gather(subject)), *args)
+        return result if post is None else post(result)
+    return call
+
+
+def _bind_fold_incremental(instance, function):
+    """bind a visitor method of an incremental :class:`FoldVisitor`"""
+    call = _bind_fold(instance, function)
+
+    def cached(subject, *args):
+        if args:
+            return call(subject, *args)
+        key = id(subject)
+        try:
+            return instance._results[key][1]
+        except KeyError:
+            pass
+        result = call(subject)
+        instance._results[key] = (subject, result)
+        return result
+    return cached
+
+
+def _balanced(combine, values, identity=None):
+    """combine `values` in order, in a balanced tree"""
+    if not values:
+        return identity
+    while len(values) > 1:
+        pairs = [combine(values[i], values[i + 1])
+                 for i in range(0, len(values) - 1, 2)]
+        if len(values) % 2:
+            pairs.append(values[-1])
+        values = pairs
+    return values[0]
+
+
+class Path(object):
+    """A persistent linked path from a visitee up to the root.
+
+    Extending a path creates one link and shares the rest, so every visitee
+    of a traversal can keep its own path without copying.
+
+    >>> path = Path('leaf', Path('branch', Path('root')))
+    >>> list(path), path.depth
+    (['leaf', 'branch', 'root'], 2)
+
+    Attributes:
+        node: the visitee at the end of the path
+        parent (Path): the path to the parent of `node`, or None at the root
+        depth (int): the number of ancestors of `node`
+
+    """
+    __slots__ = ('node', 'parent', 'depth')
+
+    def __init__(self, node, parent=None):
+        self.node = node
+        self.parent = parent
+        self.depth = 0 if parent is None else parent.depth + 1
+
+    def __iter__(self):
+        """Iterate over visitees from `node` up to the root."""
+        path = self
+        while path is not None:
+            yield path.node
+            path = path.parent
+
+    def __len__(self):
+        return self.depth + 1
+
+    def __repr__(self):
+        return 'Path({0!r})'.format(list(reversed(list(self))))
+
+
+class Scope(object):
+    """A persistent chained mapping.
+
+    Looking up a key searches the bindings of this scope, then those of its
+    parents.  Creating a child scope does not copy its parents:
+
+    >>> outer = Scope({'x': 1, 'y': 2})
+    >>> inner = outer.child({'x': 3})
+    >>> inner['x'], inner['y'], outer['x']
+    (3, 2, 1)
+
+    Bindings are not copied either, and should not be changed once the
+    scope is in use.
+
+    Attributes:
+        bindings (dict): the names bound in this scope
+        parent (Scope): the enclosing scope, or None
+
+    """
+    __slots__ = ('bindings', 'parent')
+
+    def __init__(self, bindings=None, parent=None):
+        self.bindings = {} if bindings is None else bindings
+        self.parent = parent
+
+    def child(self, bindings=None, **kwargs):
+        """Create a scope enclosed by this one.
+
+        Args:
+            bindings (dict): names bound in the new scope
+            kwargs: further names bound in the new scope
+
+        """
+        if kwargs:
+            bindings = dict(bindings or (), **kwargs)
+        return Scope(bindings, self)
+
+    def __getitem__(self, key):
+        scope = self
+        while scope is not None:
+            try:
+                return scope.bindings[key]
+            except KeyError:
+                scope = scope.parent
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __repr__(self):
+        scopes = []
+        scope = self
+        while scope is not None:
+            scopes.append(scope.bindings)
+            scope = scope.parent
+        return 'Scope({0})'.format(', '.join(repr(b) for b in scopes))
+
+
+class DescendingVisitor(Visitor):
+    """Visits parents first, passing context down to their children.
+
+    Visitor methods are passed the visitee and a context, and return the
+    context for the visitee's children.  A method that returns None passes
+    on its own context unchanged.  The outermost call is passed the context
+    given to it, or None, and returns the context for the root's children.
+
+    >>> @Visitee.create
+    ... class Block(object):
+    ...     def __init__(self, *children, **names):
+    ...         self.children = children
+    ...         self.names = names
+    >>> class Resolve(DescendingVisitor):
+    ...     def visit_Block(self, subject, scope):
+    ...         subject.scope = scope.child(subject.names)
+    ...         return subject.scope
+    >>> inner = Block(y=2)
+    >>> Resolve().dispatch(Block(inner, x=1), Scope())['x']
+    1
+    >>> inner.scope['x'], inner.scope['y']
+    (1, 2)
+
+    Visitees are traversed with an explicit stack, in pre-order, so trees of
+    any depth may be visited.  While visiting, `path` is the :class:`Path`
+    to the current visitee; paths share their ancestors, so they may be kept
+    after the visit.  :class:`Scope` provides chained scopes that are
+    similarly cheap to enter.
+
+    Attributes:
+        path (Path): the path to the visitee being visited, or None
+
+    """
+    def __init__(self, *args, **kwargs):
+        super(DescendingVisitor, self).__init__(*args, **kwargs)
+        self.path = None
+
+    _visit_wrapper = _engine_wrapper('_descend')
+
+    def _descend(self, function, subject, context=None):
+        """Visit `subject` and its descendants, or only `subject` if called
+        while visiting.
+
+        Args:
+            function (Callable): the unwrapped visitor method for `subject`
+            subject: the visitee
+            context: the context passed to `function`
+
+        """
+        if self._visiting:
+            return function(self, subject, context)
+        self._visiting = True
+        try:
+            return self._traverse(function, subject, context)
+        finally:
+            self._visiting = False
+            self.path = None
+
+    def _traverse(self, function, subject, context):
+        gather = self._gather_children
+        lookup = type(self)._dispatch_table.get
+        resolve = self._visit_function
+        path = self.path = Path(subject)
+        result = function(self, subject, context)
+        root = context if result is None else result
+        stack = [(iter(gather(subject)), path, root)]
+        push = stack.append
+        while stack:
+            children, parent, context = stack[-1]
+            for child in children:
+                path = self.path = Path(child, parent)
+                function = lookup(type(child)) or resolve(child)
+                if function is None:
+                    result = self.dispatch(child, context)
+                else:
+                    result = function(self, child, context)
+                if result is not None:
+                    context = result
+                push((iter(gather(child)), path, context))
+                break
+            else:
+                stack.pop()
+        return root
+
+
+class BreadthFirstVisitor(Visitor):
+    """Visits visitees breadth first, a level at a time.
+
+    Visiting a visitee returns an iterator over the results of each level,
+    a list per level, starting with the visitee itself.  Each level of
+    descendants, as given by :func:`Visitor.frontiers`, is visited only when
+    its results are requested, and only one level is held at a time, so
+    consume the results as they come to visit wide trees in bounded memory.
+    Additional arguments are passed to the visitor method of the root only.
+
+    >>> @Visitee.create
+    ... class Tree(object):
+    ...     def __init__(self, name, *children):
+    ...         self.name = name
+    ...         self.children = children
+    >>> class Names(BreadthFirstVisitor):
+    ...     def visit_Tree(self, subject):
+    ...         return subject.name
+    >>> levels = Names().dispatch(Tree('a', Tree('b', Tree('d')), Tree('c')))
+    >>> list(levels)
+    [['a'], ['b', 'c'], ['d']]
+
+    Before the visitees of a level are visited, the whole level is passed to
+    :func:`_enter_level`, which may, for instance, prefetch their data.
+
+    Attributes:
+        max_depth (int): the deepest level to visit, or None for all levels;
+                         the root is at depth 0
+
+    """
+    max_depth = None
+
+    _visit_wrapper = _engine_wrapper('_levels')
+
+    def _enter_level(self, frontier, depth):
+        """Method called with each level before its visitees are visited.
+
+        Args:
+            frontier (list): the visitees at this level
+            depth (int): the depth of this level
+
+        """
+        pass
+
+    def _levels(self, function, subject, *args):
+        """Visit `subject` and its descendants, or only `subject` if called
+        while visiting.
+
+        Args:
+            function (Callable): the unwrapped visitor method for `subject`
+            subject: the root visitee
+            args: additional arguments passed to `function`
+
+        Returns:
+            an iterator over the results of each level, or the result of
+            `subject` if called while visiting
+
+        """
+        if self._visiting:
+            return function(self, subject, *args)
+        return self._traverse_levels(function, subject, args)
+
+    def _traverse_levels(self, function, subject, args):
+        """Yield the results of each level, visiting it when requested.
+
+        `_visiting` is set only while a level is being visited.
+
+        """
+        frontiers = self.frontiers(subject, self.max_depth)
+        for depth, frontier in enumerate(frontiers):
+            self._enter_level(frontier, depth)
+            self._visiting = True
+            try:
+                if depth:
+                    results = self._visit_level(frontier)
+                else:
+                    results = [function(self, subject, *args)]
+            finally:
+                self._visiting = False
+            yield results
+
+    def _visit_level(self, frontier):
+        """Visit the visitees of a level, returning their results."""
+        lookup = type(self)._dispatch_table.get
+        resolve = self._visit_function
+        results = []
+        for node in frontier:
+            function = lookup(type(node)) or resolve(node)
+            if function is None:
+                results.append(self._dispatch_child(node))
+            else:
+                results.append(function(self, node))
+        return results
+
+
+class BatchingVisitor(Visitor):
+    """Visits children first, visiting visitees of the same type together.
+
+    Like :class:`CascadingVisitor`, visitor methods are passed the visitee
+    and a list of return values from visiting its children, and additional
+    arguments are passed to the visitor method of the root only.  Visitees
+    are visited in dependency order: first every leaf, then every visitee
+    whose children have all been visited, and so on.  Each distinct visitee
+    (by identity) is visited once.
+
+    The visitees of each round that share a visitor method `visit_<name>`
+    are visited by a single call to `visit_batch_<name>`, if defined.  It is
+    passed the list of visitees and the list of their children's results,
+    and returns the list of their results, in the same order:
+
+    >>> @Visitee.create
+    ... class Num(object):
+    ...     def __init__(self, value, *children):
+    ...         self.value = value
+    ...         self.children = children
+    >>> class Sum(BatchingVisitor):
+    ...     def visit_Num(self, subject, children):
+    ...         return subject.value + sum(children)
+    ...     def visit_batch_Num(self, subjects, children):
+    ...         return [s.value + sum(c) for s, c in zip(subjects, children)]
+    >>> Sum().dispatch(Num(1, Num(2), Num(3, Num(4))))
+    10
+
+    Otherwise, or for the root, `visit_<name>` is called for each visitee.
+    Visitees without a visitor method of their own, whose `accept` method
+    must be called, are visited by :func:`Visitor.dispatch`, in a separate
+    traversal.
+
+    """
+    _visit_wrapper = _engine_wrapper('_batches')
+
+    @classmethod
+    def _visit_name(cls, subject):
+        """Find the name of the visitor method for a visitee that has one.
+
+        Visitees are grouped by this name, not by the method itself, which
+        may be shared by several names.
+
+        """
+        name = cls._resolve(subject)
+        if name == '_dispatch_kind':
+            name = 'visit_' + str(subject[cls.kind_key])
+            if not hasattr(cls, name):
+                name = 'generic_visit'
+        return name
+
+    @classmethod
+    def _group(cls, subject):
+        """Find the unwrapped visitor method for a visitee and the name its
+        visitees are grouped by.
+
+        Results are cached per visitee type, unless visited by kind.
+
+        Returns:
+            tuple: the visitor function and its name, or `(None, None)` if
+            the visitee must be visited through :func:`dispatch`
+
+        """
+        name = None
+        function = cls._visit_function(subject)
+        if function is not None:
+            name = cls._visit_name(subject)
+        if not cls._by_kind(subject):
+            cls._group_table[type(subject)] = function, name
+        return function, name
+
+    @classmethod
+    def _batch_function(cls, name):
+        """Find the unwrapped batch method for a visitor method name.
+
+        Returns:
+            the `visit_batch_<name>` function for the name `visit_<name>`, or
+            None
+
+        """
+        if name is None or not name.startswith('visit_'):
+            return None
+        return _unwrapped(getattr(cls, 'visit_batch_' + name[6:], None))
+
+    def _batches(self, function, subject, *args):
+        """Visit `subject` and its descendants.
+
+        Args:
+            function (Callable): the unwrapped visitor method for `subject`
+            subject: the root visitee
+            args: additional arguments passed to `function`
+
+        """
+        outermost = not self._visiting
+        self._visiting = True
+        try:
+            rounds = self._rounds(subject)
+            (_, _, children), = rounds.pop().values()
+            results = {}
+            for visitees in rounds:
+                self._visit_round(visitees, results)
+            children = [results[key] for key in children[0]]
+            return function(self, subject, children, *args)
+        finally:
+            if outermost:
+                self._visiting = False
+
+    def _rounds(self, subject):
+        """Sort `subject` and its descendants into rounds.
+
+        Each visitee's id is taken once, and its children are recorded by
+        id, which is how :func:`_visit_round` finds their results.
+
+        Returns:
+            list: for each round, a dict mapping each visitor method name
+            to the unwrapped visitor method, the list of its visitees in the
+            round and the list of the ids of their children, or None for
+            leaves; visitees without a visitor method are under None; the
+            last round is only `subject`
+
+        """
+        gather = self._gather_children
+        lookup = type(self)._group_table.get
+        group = type(self)._group
+        heights = {}
+        leaves = {}
+        rounds = [leaves]
+        stack = [(subject, None, None, iter(gather(subject)), [])]
+        while stack:
+            node, name, function, pending, keys = stack[-1]
+            for child in pending:
+                key = id(child)
+                keys.append(key)
+                if key in heights:
+                    continue
+                child_function, child_name = (lookup(type(child)) or
+                                              group(child))
+                grandchildren = None
+                if child_function is not None:
+                    grandchildren = gather(child)
+                if grandchildren:
+                    stack.append((child, child_name, child_function,
+                                  iter(grandchildren), []))
+                    break
+                # leaves are added without a stack frame
+                heights[key] = 0
+                try:
+                    leaves[child_name][1].append(child)
+                except KeyError:
+                    leaves[child_name] = (child_function, [child], None)
+            else:
+                stack.pop()
+                height = 1 + max([heights[k] for k in keys] or [-1])
+                heights[id(node)] = height
+                _add_visitee(rounds, height, node, name, function, keys)
+        return rounds
+
+    def _visit_round(self, groups, results):
+        """Visit one round, a group at a time.
+
+        Args:
+            groups (dict): the visitees of each visitor method and their
+                           children, as made by :func:`_rounds`
+            results (dict): results of visited visitees, keyed by id; updated
+                            with the results of this round
+
+        Raises:
+            ValueError: if a batch method returns the wrong number of results
+
+        """
+        for name, (function, nodes, children) in groups.items():
+            if children is None:
+                children = [[] for node in nodes]
+            else:
+                children = [[results[key] for key in c] for c in children]
+            batch = type(self)._batch_function(name)
+            if function is None:
+                values = [self.dispatch(node) for node in nodes]
+            elif batch is None:
+                values = list(map(functools.partial(function, self), nodes,
+                                  children))
+            else:
+                values = batch(self, nodes, children)
+                if len(values) != len(nodes):
+                    raise ValueError('{0} returned {1} results for {2} '
+                                     'visitees'.format(batch.__name__,
+                                                       len(values),
+                                                       len(nodes)))
+            results.update(zip(map(id, nodes), values))
+
+
+def _add_visitee(rounds, height, node, name, function, keys):
+    """add a visitee and the ids of its children to its round and group for
+    :class:`BatchingVisitor`"""
+    if height == len(rounds):
+        rounds.append({})
+    group = rounds[height].get(name)
+    if group is None:
+        group = rounds[height][name] = (function, [], [])
+    group[1].append(node)
+    group[2].append(keys)
+
+
+class GeneratorVisitor(Visitor):
+    """Visits visitees with generator visitor methods.
+
+    A visitor method may be a generator, which yields a visitee to visit it
+    and receives the result.  Its own result is its return value:
+
+    .. code-block:: python
+
+        class Sum(GeneratorVisitor):
+            def visit_Node(self, subject):
+                total = subject.value
+                for child in subject.children:
+                    total += yield child
+                return total
+
+    Generators can only return a value from Python 3.3; earlier, their
+    result is None.  Visitor methods that are plain functions return their
+    result as usual.  Visitor methods choose which children to visit, and in
+    which order:
+
+    >>> @Visitee.create
+    ... class Node(object):
+    ...     def __init__(self, value, *children):
+    ...         self.value = value
+    ...         self.children = children
+    >>> class Reverse(GeneratorVisitor):
+    ...     def __init__(self):
+    ...         super(Reverse, self).__init__()
+    ...         self.values = []
+    ...     def visit_Node(self, subject):
+    ...         self.values.append(subject.value)
+    ...         for child in reversed(subject.children):
+    ...             yield child
+    >>> visitor = Reverse()
+    >>> visitor.dispatch(Node(1, Node(2), Node(3, Node(4))))
+    >>> visitor.values
+    [1, 3, 4, 2]
+
+    They may also yield visitees created during the visit.  Generators are
+    resumed by a loop with an explicit stack, so trees of any depth may be
+    visited.  An exception raised while visiting a yielded visitee is raised
+    by the `yield` expression.  Additional arguments are passed to the
+    visitor method of the root only.
+
+    """
+    _visit_wrapper = _engine_wrapper('_trampoline')
+
+    def _trampoline(self, function, subject, *args):
+        """Visit `subject`, resuming generators until it has a result.
+
+        Args:
+            function (Callable): the unwrapped visitor method for `subject`
+            subject: the visitee
+            args: additional arguments passed to `function`
+
+        """
+        result = function(self, subject, *args)
+        if not isinstance(result, types.GeneratorType):
+            return result
+        outermost = not self._visiting
+        self._visiting = True
+        try:
+            return self._resume(result)
+        finally:
+            if outermost:
+                self._visiting = False
+
+    def _resume(self, generator):
+        visit = self._visit_yielded
+        stack = [generator]
+        value = error = None
+        while stack:
+            try:
+                if error is None:
+                    child = stack[-1].send(value)
+                else:
+                    child, error = stack[-1].throw(error), None
+            except StopIteration as stop:
+                stack.pop()
+                value, error = getattr(stop, 'value', None), None
+                continue
+            except Exception as exc:
+                stack.pop()
+                if not stack:
+                    raise
+                error = exc
+                continue
+            try:
+                value = visit(child)
+            except Exception as exc:
+                error = exc
+                continue
+            if isinstance(value, types.GeneratorType):
+                stack.append(value)
+                value = None
+        return value
+
+    def _visit_yielded(self, child):
+        """Call the visitor method for a yielded visitee.
+
+        Returns:
+            the result, or a generator to resume
+
+        """
+        function = type(self)._visit_function(child)
+        if function is None:
+            return self.dispatch(child)
+        return function(self, child)
+
+
+class BestFirstVisitor(Visitor):
+    """Visits the most promising visitees first.
+
+    Visiting a visitee searches it and its descendants for the visitees
+    with the lowest scores.  Each visitor method returns the score of its
+    visitee, or None if the visitee is not a candidate; additional arguments
+    are passed to the visitor method of the root only.  The search returns
+    a sorted list of `(score, visitee)` for the best `keep` candidates.
+
+    Unvisited visitees are kept in a heap, ordered by :func:`_priority`, and
+    the one with the lowest priority is visited next.  A visitee is not
+    visited, nor are its descendants, if :func:`_bound` shows that none of
+    them can score lower than every kept candidate.  If `budget` visitees
+    have been visited, the search stops and returns the best candidates so
+    far, and `exhausted` is set.
+
+    >>> @Visitee.create
+    ... class Plan(object):
+    ...     def __init__(self, cost, *children):
+    ...         self.cost = cost
+    ...         self.children = children
+    >>> class Cheapest(BestFirstVisitor):
+    ...     def _priority(self, subject):
+    ...         return subject.cost
+    ...     def _bound(self, subject):
+    ...         return subject.cost  # costs grow towards the leaves
+    ...     def visit_Plan(self, subject):
+    ...         if not subject.children:
+    ...             return subject.cost
+    >>> tree = Plan(0, Plan(5, Plan(6)), Plan(1, Plan(3), Plan(4)))
+    >>> [score for score, plan in Cheapest().dispatch(tree)]
+    [3]
+
+    To find the highest scores instead, negate them.
+
+    Attributes:
+        keep (int): the number of candidates to keep
+        budget (int): the largest number of visitees to visit, or None
+        exhausted (bool): whether the last search ran out of budget
+
+    """
+    keep = 1
+    budget = None
+
+    def __init__(self, *args, **kwargs):
+        super(BestFirstVisitor, self).__init__(*args, **kwargs)
+        self.exhausted = False
+
+    _visit_wrapper = _engine_wrapper('_best_first')
+
+    def _priority(self, subject):
+        """The order in which to visit a visitee; lower is sooner.
+
+        By default, visitees are visited in the order they are found.
+
+        """
+        return 0
+
+    def _bound(self, subject):
+        """A lower bound on the scores of a visitee and its descendants.
+
+        Returns:
+            the bound, or None if there is none; by default, None
+
+        """
+        return None
+
+    def _best_first(self, function, subject, *args):
+        """Search `subject` and its descendants, or only visit `subject` if
+        called while visiting.
+
+        Args:
+            function (Callable): the unwrapped visitor method for `subject`
+            subject: the root visitee
+            args: additional arguments passed to `function`
+
+        """
+        if self._visiting:
+            return function(self, subject, *args)
+        self._visiting = True
+        self.exhausted = False
+        try:
+            return self._search(function, subject, args)
+        finally:
+            self._visiting = False
+
+    def _search(self, function, subject, args):
+        gather = self._gather_children
+        priority = self._priority
+        bound = self._bound
+        keep = self.keep
+        budget = self.budget
+        count = itertools.count()
+        best = []
+        heap = [(priority(subject), next(count), bound(subject), subject)]
+        visited = 0
+        while heap:
+            _, _, lower, node = heapq.heappop(heap)
+            if _bounded(best, keep, lower):
+                continue
+            if budget is not None and visited >= budget:
+                self.exhausted = True
+                break
+            visited += 1
+            if visited == 1:
+                score = function(self, subject, *args)
+            else:
+                score = self._visit_candidate(node)
+            if score is not None:
+                bisect.insort(best, (score, next(count), node))
+                del best[keep:]
+            for child in gather(node):
+                lower = bound(child)
+                if not _bounded(best, keep, lower):
+                    entry = (priority(child), next(count), lower, child)
+                    heapq.heappush(heap, entry)
+        return [(score, node) for score, _, node in best]
+
+    def _visit_candidate(self, subject):
+        """Call the visitor method for a visitee, returning its score."""
+        function = type(self)._visit_function(subject)
+        if function is None:
+            return self.dispatch(subject)
+        return function(self, subject)
+
+
+def _bounded(best, keep, lower):
+    """whether a visitee with the bound `lower` cannot improve on `best`"""
+    return lower is not None and len(best) >= keep and lower >= best[-1][0]
+
+
+class GraphVisitor(Visitor):
+    """Visits directed graphs, which may have cycles, to a fixed point.
+
+    Visitees are graph nodes, and their children, found by
+    :func:`Visitor._gather_children`, are their successors.  As with
+    :class:`CascadingVisitor`, visitor methods are passed the visitee and a
+    list of the results of its children, and additional arguments are
+    passed to the visitor method of the root only.  Visiting a visitee
+    visits every visitee reachable from it, and returns its result.
+
+    The strongly connected components of the graph are visited in
+    topological order, successors first.  A visitee outside any cycle is
+    visited once.  The visitees of a cycle start with the result `bottom`,
+    and are visited from a worklist: each new result is combined with the
+    previous one by :func:`_join`, and, if :func:`_equal` shows that it
+    changed, the visitee's predecessors in the cycle are visited again:
+
+    >>> @Visitee.create
+    ... class Block(object):
+    ...     def __init__(self, name):
+    ...         self.name = name
+    ...         self.children = []
+    >>> class Reachable(GraphVisitor):
+    ...     bottom = frozenset()
+    ...     def _join(self, old, new):
+    ...         return old | new
+    ...     def visit_Block(self, subject, children):
+    ...         return frozenset([subject.name]).union(*children)
+    >>> a, b, c = Block('a'), Block('b'), Block('c')
+    >>> a.children.append(b)
+    >>> b.children.extend((a, c))
+    >>> sorted(Reachable().dispatch(a))
+    ['a', 'b', 'c']
+
+    Results are kept for every visitee visited, in `results`.  Visitees are
+    identified by identity, and must stay alive during the visit.
+
+    Attributes:
+        bottom: the first result of visitees in cycles
+        results (dict): the result of each visitee of the last visit, keyed
+                        by the visitee's id
+
+    """
+    bottom = None
+
+    def __init__(self, *args, **kwargs):
+        super(GraphVisitor, self).__init__(*args, **kwargs)
+        self.results = {}
+        self._children_results = None
+
+    _visit_wrapper = _engine_wrapper('_graph')
+
+    def _join(self, old, new):
+        """Combine the previous and new results of a visitee in a cycle.
+
+        By default, returns `new`.
+
+        """
+        return new
+
+    def _equal(self, old, new):
+        """Whether the result of a visitee in a cycle is unchanged."""
+        return old == new
+
+    def _graph(self, function, subject, *args):
+        """Visit `subject` and every visitee reachable from it, or only
+        `subject` if called while visiting.
+
+        Args:
+            function (Callable): the unwrapped visitor method for `subject`
+            subject: the root visitee
+            args: additional arguments passed to `function`
+
+        """
+        if self._visiting:
+            # a visitee visited through its accept method
+            return function(self, subject, self._children_results, *args)
+        self._visiting = True
+        self.results = results = {}
+        edges = {}
+        try:
+            for component in self._components(subject, edges):
+                if _cyclic(component, edges):
+                    self._fixed_point(component, edges, subject, args)
+                else:
+                    node, = component
+                    results[id(node)] = self._transfer(node, edges, subject,
+                                                       args)
+            return results[id(subject)]
+        finally:
+            self._visiting = False
+            self._children_results = None
+
+    def _components(self, subject, edges):
+        """Find the strongly connected components reachable from `subject`.
+
+        Uses Tarjan's algorithm, with an explicit stack.
+
+        Args:
+            subject: the root visitee
+            edges (dict): filled with the children of each visitee, keyed by
+                          the visitee's id
+
+        Yields:
+            list: the visitees of each component, successors first
+
+        """
+        gather = self._gather_children
+        index = {}
+        low = {}
+        found = []
+        on_stack = set()
+        stack = [(None, iter((subject,)))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                key = id(child)
+                if key not in index:
+                    index[key] = low[key] = len(index)
+                    found.append(child)
+                    on_stack.add(key)
+                    edges[key] = list(gather(child))
+                    stack.append((child, iter(edges[key])))
+                    break
+                if key in on_stack:
+                    low[id(node)] = min(low[id(node)], index[key])
+            else:
+                stack.pop()
+                if node is None:
+                    continue
+                key = id(node)
+                parent = stack[-1][0]
+                if parent is not None:
+                    low[id(parent)] = min(low[id(parent)], low[key])
+                if low[key] == index[key]:
+                    yield _pop_component(found, on_stack, node)
+
+    def _transfer(self, node, edges, subject, args):
+        """Visit `node` with the current results of its children."""
+        bottom = self.bottom
+        results = self.results
+        children = [results.get(id(child), bottom)
+                    for child in edges[id(node)]]
+        function = type(self)._visit_function(node)
+        if node is not subject:
+            args = ()
+        if function is None:
+            self._children_results = children
+            return self.dispatch(node, *args)
+        return function(self, node, children, *args)
+
+    def _fixed_point(self, component, edges, subject, args):
+        """Visit the visitees of a cycle until their results do not change.
+        """
+        results = self.results
+        members = dict((id(node), []) for node in component)
+        for node in component:
+            for child in edges[id(node)]:
+                predecessors = members.get(id(child))
+                if predecessors is not None:
+                    predecessors.append(node)
+        for key in members:
+            results[key] = self.bottom
+        worklist = collections.deque(component)
+        queued = set(members)
+        while worklist:
+            node = worklist.popleft()
+            key = id(node)
+            queued.discard(key)
+            old = results[key]
+            new = self._join(old, self._transfer(node, edges, subject, args))
+            if self._equal(old, new):
+                continue
+            results[key] = new
+            for predecessor in members[key]:
+                if id(predecessor) not in queued:
+                    queued.add(id(predecessor))
+                    worklist.append(predecessor)
+
+
+def _cyclic(component, edges):
+    """whether a strongly connected component has a cycle"""
+    if len(component) > 1:
+        return True
+    node, = component
+    return any(child is node for child in edges[id(node)])
+
+
+def _pop_component(found, on_stack, node):
+    """pop the strongly connected component rooted at `node` for
+    :func:`GraphVisitor._components`"""
+    component = []
+    while True:
+        member = found.pop()
+        on_stack.discard(id(member))
+        component.append(member)
+        if member is node:
+            return component
+
+
+class AttributeCycleError(ValueError):
+    """An attribute of a visitee depends on itself."""
+
+
+class _Attribute(object):
+    """An attribute declared on an :class:`AttributeVisitor`.
+
+    On a visitor, the attribute is a function of a visitee that computes
+    the attribute on first use and caches it.
+
+    Attributes:
+        function (Callable): the function computing the attribute
+        inherited (bool): whether `function` is also passed the parent
+
+    """
+    def __init__(self, function, inherited):
+        functools.update_wrapper(self, function)
+        self.function = function
+        self.inherited = inherited
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        bound = functools.partial(instance._attribute, self)
+        try:
+            instance.__dict__[self.__name__] = bound
+        except AttributeError:
+            # visitor has no instance dictionary; bind on each access
+            pass
+        return bound
+
+
+class AttributeVisitor(Visitor):
+    """Evaluates attributes of visitees on demand.
+
+    Attributes are declared as methods with :func:`synthesized`, for
+    attributes computed from the visitee, and typically its children, or
+    :func:`inherited`, for attributes computed from the visitee's parent.
+    Calling an attribute computes it for a visitee the first time, and
+    returns the cached value after that, so attributes may depend on each
+    other in any order:
+
+    >>> @Visitee.create
+    ... class Node(object):
+    ...     def __init__(self, *children):
+    ...         self.children = children
+    >>> class Shape(AttributeVisitor):
+    ...     @AttributeVisitor.synthesized
+    ...     def height(self, subject):
+    ...         return 1 + max([self.height(c) for c in subject.children] or
+    ...                        [-1])
+    ...     @AttributeVisitor.inherited
+    ...     def depth(self, subject, parent):
+    ...         return 0 if parent is None else self.depth(parent) + 1
+    ...     def visit_Node(self, subject):
+    ...         leaf = subject.children[0].children[0]
+    ...         return self.height(subject), self.depth(leaf)
+    >>> Shape().dispatch(Node(Node(Node()), Node()))
+    (2, 2)
+
+    The outermost visitor method call starts a new evaluation, for the tree
+    rooted at its visitee: cached attributes are discarded, and parents are
+    found by :func:`Visitor._gather_children` when an inherited attribute is
+    first needed.  Attributes remain available after the call.  Visitees are
+    identified by identity.
+
+    Attributes are evaluated recursively, so the depth of dependencies is
+    limited by the recursion limit.
+
+    """
+    def __init__(self, *args, **kwargs):
+        super(AttributeVisitor, self).__init__(*args, **kwargs)
+        self._root = None
+        self._parents = None
+        self._cache = {}
+        self._pending = set()
+
+    @classmethod
+    def synthesized(cls, func):
+        """Declare an attribute computed from a visitee.
+
+        The decorated method is passed the visitee.
+
+        """
+        return _Attribute(func, inherited=False)
+
+    @classmethod
+    def inherited(cls, func):
+        """Declare an attribute computed from a visitee's parent.
+
+        The decorated method is passed the visitee and its parent, which is
+        None for the root.
+
+        """
+        return _Attribute(func, inherited=True)
+
+    _visit_wrapper = _engine_wrapper('_evaluate')
+
+    def _evaluate(self, function, subject, *args):
+        """Start an evaluation rooted at `subject`, unless called while
+        visiting, and call `function`.
+        """
+        if self._visiting:
+            return function(self, subject, *args)
+        self._root = subject
+        self._parents = None
+        self._cache = {}
+        self._pending = set()
+        self._visiting = True
+        try:
+            return function(self, subject, *args)
+        finally:
+            self._visiting = False
+
+    def _attribute(self, attribute, subject):
+        """Find the value of an attribute of a visitee, computing it if needed.
+
+        Raises:
+            AttributeCycleError: if the attribute depends on itself
+
+        """
+        key = (id(subject), attribute)
+        try:
+            return self._cache[key][1]
+        except KeyError:
+            pass
+        if key in self._pending:
+            raise AttributeCycleError('{0} of {1!r} depends on itself'.format(
+                attribute.__name__, subject))
+        self._pending.add(key)
+        try:
+            if attribute.inherited:
+                parent = self._parent(subject)
+                value = attribute.function(self, subject, parent)
+            else:
+                value = attribute.function(self, subject)
+        finally:
+            self._pending.discard(key)
+        # keep the visitee, so that its id is not reused
+        self._cache[key] = (subject, value)
+        return value
+
+    def _parent(self, subject):
+        """Find the parent of a visitee of the current tree.
+
+        Raises:
+            ValueError: if `subject` is not in the tree
+
+        """
+        if subject is self._root:
+            return None
+        if self._parents is None:
+            self._parents = self._find_parents(self._root)
+        try:
+            return self._parents[id(subject)]
+        except KeyError:
+            raise ValueError('{0!r} is not in the visited tree'.format(
+                subject))
+
+    def _find_parents(self, root):
+        """Map the id of each descendant of `root` to its parent."""
+        gather = self._gather_children
+        parents = {}
+        pending = [] if root is None else [root]
+        while pending:
+            node = pending.pop()
+            for child in gather(node):
+                if id(child) not in parents:
+                    parents[id(child)] = node
+                    pending.append(child)
+        return parents
@@ -1,21 +1,18 @@
 # various 2to3 fixes
-import functools
-
-class partialmethod(object):
-    def __init__(self, wrapped_function, *args, **kwargs):
-        self.function = wrapped_function
-        self.args = args
-        self.kwargs = kwargs
-    def __get__(self, instance, *args, **kwargs):
-        if instance is None:
-            return self
-        else:
-            return functools.partial(self.function, instance, *self.args, **self.kwargs)
+import sys
 
 # borrowed from six.py:
 # Copyright (c) 2010-2018 Benjamin Peterson
 # https://github.com/benjaminp/six
 # commit: a611f60
+PY2 = sys.version_info[0] == 2
+
+if PY2:
+    string_types = basestring,
+else:
+    string_types = str,
+
+
 def with_metaclass(meta, *bases):
     class metaclass(type):
         def __new__(cls, name, this_bases, d):
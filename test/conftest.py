@@ -0,0 +1,6 @@
+import sys
+
+collect_ignore = []
+if sys.version_info < (3, 3):
+    # generator visitor methods return their results
+    collect_ignore.append('test_generator.py')
@@ -0,0 +1,111 @@
+import doorbell
+import pytest
+
+
+@doorbell.Visitee.create
+class Let(object):
+    """binds `name` to the value of the first child in the second"""
+    def __init__(self, name, value, body):
+        self.name = name
+        self.children = [value, body]
+
+
+@doorbell.Visitee.create
+class Num(object):
+    children = ()
+
+    def __init__(self, value):
+        self.value = value
+
+
+@doorbell.Visitee.create
+class Ref(object):
+    children = ()
+
+    def __init__(self, name):
+        self.name = name
+
+
+class Evaluate(doorbell.AttributeVisitor):
+    def __init__(self):
+        super(Evaluate, self).__init__()
+        self.computed = []
+
+    @doorbell.AttributeVisitor.inherited
+    def env(self, subject, parent):
+        """the Let binding each name in scope"""
+        self.computed.append(('env', subject))
+        if parent is None:
+            return doorbell.Scope()
+        env = self.env(parent)
+        if subject is parent.children[1]:
+            env = env.child({parent.name: parent})
+        return env
+
+    @doorbell.AttributeVisitor.synthesized
+    def value(self, subject):
+        self.computed.append(('value', subject))
+        if isinstance(subject, Num):
+            return subject.value
+        if isinstance(subject, Ref):
+            return self.value(self.env(subject)[subject.name].children[0])
+        return self.value(subject.children[1])
+
+    def visit_Let(self, subject):
+        return self.value(subject)
+
+
+def test_evaluate():
+    unused = Num(5)
+    tree = Let('x', Num(1), Let('y', Ref('x'), Let('z', unused, Ref('y'))))
+    visitor = Evaluate()
+    assert visitor.dispatch(tree) == 1
+    assert ('value', unused) not in visitor.computed
+    assert len(visitor.computed) == len(set(visitor.computed))
+
+
+def test_cached():
+    ref = Ref('x')
+    tree = Let('x', Num(2), ref)
+    visitor = Evaluate()
+    assert visitor.dispatch(tree) == 2
+    count = len(visitor.computed)
+    # attributes remain available after the visit
+    assert visitor.value(ref) == 2
+    assert visitor.env(ref)['x'] is tree
+    assert len(visitor.computed) == count
+
+
+def test_new_evaluation():
+    visitor = Evaluate()
+    assert visitor.dispatch(Let('x', Num(2), Ref('x'))) == 2
+    assert visitor.dispatch(Let('x', Num(3), Ref('x'))) == 3
+
+
+def test_cycle():
+    class Cyclic(Evaluate):
+        @doorbell.AttributeVisitor.synthesized
+        def value(self, subject):
+            return self.value(subject)
+
+    visitor = Cyclic()
+    with pytest.raises(doorbell.AttributeCycleError) as info:
+        visitor.dispatch(Let('x', Num(1), Ref('x')))
+    assert isinstance(info.value, ValueError)
+    assert 'value' in str(info.value)
+    assert not visitor._pending and not visitor._visiting
+
+
+def test_not_in_tree():
+    visitor = Evaluate()
+    visitor.dispatch(Let('x', Num(1), Ref('x')))
+    with pytest.raises(ValueError):
+        visitor.env(Ref('x'))
+
+
+def test_deep():
+    tree = Ref('x')
+    for i in range(200):
+        tree = Let('y{0}'.format(i), Num(i), tree)
+    tree = Let('x', Num(-1), tree)
+    assert Evaluate().dispatch(tree) == -1
@@ -1,12 +1,36 @@
+import copy
+import gc
+import pickle
+import sys
+
 import doorbell
 import pytest
 
 
+# subclasses of classes decorated in place that do not derive from Visitee
+# are set up by __init_subclass__
+requires_init_subclass = pytest.mark.skipif(
+    sys.version_info < (3, 6), reason='requires __init_subclass__')
+
+
 def test_create_accept_invalid():
     with pytest.raises(ValueError):
         doorbell._create_accept("123")
 
 
+@pytest.mark.parametrize('name', ['', 'a b', 'a.b', 'a\n', 'a(self)'])
+def test_create_accept_invalid_names(name):
+    with pytest.raises(ValueError):
+        doorbell._create_accept(name)
+
+
+def test_create_accept_shared():
+    accept = doorbell._create_accept('Shared')
+    assert doorbell._create_accept('Shared') is accept
+    assert accept._autocreate == 'Shared'
+    assert doorbell._create_accept('Other') is not accept
+
+
 class TestVisitorDecorator:
     class Value(doorbell.Visitee):
         def __init__(self, value=0):
@@ -223,3 +247,518 @@ class TestVisiteeMultipleAutoCreate:
             @doorbell.Visitee.stop_auto_create
             class ClassStopAutoNonAuto(self.ValueNonAuto):
                 pass
+
+
+class Collecting(doorbell.CascadingVisitor):
+    def __init__(self):
+        super(Collecting, self).__init__()
+        self.seen = []
+
+    def visit_Value(self, obj, children):
+        self.seen.append(obj)
+        return len(self.seen)
+
+
+class TestVisitorBinding:
+    @doorbell.Visitee.create
+    class Value(object):
+        pass
+
+    class Visitor(doorbell.Visitor):
+        def visit_Value(self, obj):
+            return self
+
+    class Wrapped(Visitor):
+        def _visit_wrapper(self, *args, **kwargs):
+            return 'wrapped', kwargs['function'](self, *args)
+
+    def test_direct(self):
+        v = self.Visitor()
+        assert v.visit_Value.__func__ is vars(self.Visitor)[
+            'visit_Value'].function
+        assert self.Value().accept(v) is v
+
+    def test_bound_once(self):
+        v = self.Visitor()
+        assert v.visit_Value is v.visit_Value
+
+    def test_wrapped(self):
+        v = self.Wrapped()
+        assert self.Value().accept(v) == ('wrapped', v)
+
+    def test_copy(self):
+        node = self.Value()
+        node.children = []
+        v = Collecting()
+        assert [v.dispatch(node), node.accept(v), v.visit_Value(node)] == [
+            1, 2, 3]
+        v.seen = []
+        copies = [copy.copy(v), copy.deepcopy(v),
+                  pickle.loads(pickle.dumps(v, pickle.HIGHEST_PROTOCOL))]
+        for copied in copies:
+            copied.seen = []
+            assert [copied.dispatch(node), node.accept(copied),
+                    copied.visit_Value(node)] == [1, 2, 3]
+            assert copied.seen == [node] * 3
+        assert v.seen == []
+
+    def test_subclass_wrapper(self):
+        class Cascading(doorbell.CascadingVisitor):
+            @doorbell.Visitor.visitor_method
+            def goto_Value(self, obj, children):
+                return children
+
+        node = self.Value()
+        node.children = []
+        assert Cascading().goto_Value(node) == []
+
+
+class TestDispatch:
+    @doorbell.Visitee.create
+    class Value(object):
+        pass
+
+    class Custom(doorbell.Visitee):
+        def accept(self, visitor, *args):
+            return visitor.goto_Custom(self, *args)
+
+    class Missing(doorbell.Visitee):
+        def accept(self, visitor):
+            return visitor.visit_Missing(self)
+
+    class Opaque(doorbell.Visitee):
+        def accept(self, visitor):
+            return 'opaque'
+
+    class Visitor(doorbell.Visitor):
+        def visit_Value(self, obj):
+            return 'Value'
+
+        @doorbell.Visitor.visitor_method
+        def goto_Custom(self, obj, *args):
+            return args
+
+    def test_dispatch(self):
+        v = self.Visitor()
+        assert v.dispatch(self.Value()) == 'Value'
+        assert v.dispatch(self.Custom(), 1, 2) == (1, 2)
+        assert v.dispatch(self.Opaque()) == 'opaque'
+
+    def test_cached(self):
+        v = self.Visitor()
+        node = self.Value()
+        v.dispatch(node)
+        assert v._handlers[self.Value] == v.visit_Value
+        function = vars(self.Visitor)['visit_Value'].function
+        assert v._visit_function(node) is function
+        assert self.Visitor._dispatch_table[self.Value] is function
+
+    def test_missing(self):
+        with pytest.raises(AttributeError):
+            self.Visitor().dispatch(self.Missing())
+
+
+class TestSlots:
+    class Plain(object):
+        __slots__ = ('value',)
+
+        def __init__(self, value=None):
+            self.value = value
+
+    Value = doorbell.Visitee.create(Plain)
+
+    @doorbell.Visitee.auto_create
+    class Auto(Plain):
+        __slots__ = ()
+
+    @doorbell.Visitee.stop_auto_create
+    class Stopped(Auto):
+        __slots__ = ()
+
+    def test_no_dict(self):
+        size = sys.getsizeof(self.Plain())
+        for cls in (self.Value, self.Auto, self.Stopped):
+            node = cls()
+            assert not hasattr(node, '__dict__')
+            assert sys.getsizeof(node) == size
+
+    def test_memory(self):
+        tracemalloc = pytest.importorskip('tracemalloc')
+        # enough nodes that per-node size dominates; more only slows the run
+        count = 10000
+
+        def measure(cls):
+            tracemalloc.start()
+            try:
+                nodes = [cls() for i in range(count)]
+                size = tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+            assert len(nodes) == count
+            return size
+
+        plain = measure(self.Plain)
+        assert measure(self.Value) < plain * 1.05
+        assert measure(self.Auto) < plain * 1.05
+
+
+class TestInplace:
+    @doorbell.Visitee.create(inplace=True)
+    class Value(object):
+        __slots__ = ()
+
+    @doorbell.Visitee.create('Other', inplace=True)
+    class Value2(doorbell.Visitee):
+        pass
+
+    @doorbell.Visitee.auto_create(inplace=True)
+    class Auto(object):
+        pass
+
+    class Auto2(Auto):
+        pass
+
+    @doorbell.Visitee.auto_create(lambda i: i.upper(), inplace=True)
+    class AutoUpper(Auto):
+        pass
+
+    class AutoUpper2(AutoUpper):
+        pass
+
+    @doorbell.Visitee.stop_auto_create(inplace=True)
+    class AutoStop(Auto):
+        pass
+
+    class AutoStop2(AutoStop):
+        pass
+
+    class Visitor(doorbell.Visitor):
+        def _get(self, obj):
+            return type(obj).__name__
+
+        visit_Value = visit_Other = visit_Auto = visit_Auto2 = _get
+        visit_AUTOUPPER = visit_AUTOUPPER2 = visit_Child = _get
+
+    def test_mro(self):
+        assert self.Value.__mro__ == (self.Value, object)
+        assert self.Value2.__mro__[1:] == (doorbell.Visitee, object)
+        assert self.Auto2.__mro__ == (self.Auto2, self.Auto, object)
+        assert isinstance(self.Value(), doorbell.Visitee)
+        assert isinstance(self.Auto2(), doorbell.Visitee)
+
+    def test_accept(self):
+        v = self.Visitor()
+        assert self.Value().accept(v) == 'Value'
+        assert self.Value2().accept(v) == 'Value2'
+        assert self.Auto().accept(v) == 'Auto'
+
+    @requires_init_subclass
+    def test_accept_subclass(self):
+        v = self.Visitor()
+        assert self.Auto2().accept(v) == 'Auto2'
+        assert self.AutoUpper().accept(v) == 'AutoUpper'
+        assert self.AutoUpper2().accept(v) == 'AutoUpper2'
+        assert self.AutoStop().accept(v) == 'AutoStop'
+        assert self.AutoStop2().accept(v) == 'AutoStop2'
+
+    @requires_init_subclass
+    def test_name_used(self):
+        with pytest.raises(ValueError):
+            class Auto2(self.Auto):
+                pass
+
+    @requires_init_subclass
+    def test_init_subclass(self):
+        @doorbell.Visitee.auto_create(inplace=True)
+        class Base(object):
+            def __init_subclass__(cls, **kwargs):
+                cls.initialized = True
+
+        class Child(Base):
+            pass
+
+        assert Child.initialized
+        assert Child().accept(self.Visitor()) == 'Child'
+
+
+class TestTags:
+    @doorbell.Visitee.create
+    class Value(object):
+        pass
+
+    @doorbell.Visitee.auto_create
+    class Auto(object):
+        pass
+
+    class Auto2(Auto):
+        pass
+
+    @doorbell.Visitee.create(inplace=True)
+    class Inplace(object):
+        pass
+
+    class Inplace2(Inplace):
+        def accept(self, visitor):
+            return visitor.visit_Inplace2(self)
+
+    class Visitor(doorbell.Visitor):
+        def _get(self, obj):
+            return type(obj).__name__
+
+        visit_Value = visit_Auto = visit_Auto2 = _get
+        visit_Inplace = visit_Inplace2 = _get
+
+    classes = (Value, Auto, Auto2, Inplace)
+    if sys.version_info >= (3, 6):
+        # tagged by __init_subclass__
+        classes += (Inplace2,)
+
+    def test_unique(self):
+        tags = [vars(cls)['_tag'] for cls in self.classes]
+        assert len(set(tags)) == len(tags)
+        for cls in self.classes:
+            tag = doorbell.Visitee.type_tag(cls)
+            assert doorbell.Visitee.tagged_class(tag) is cls
+        assert doorbell.Visitee.type_tag(doorbell.Visitee) == 0
+
+    def test_sequential(self):
+        @doorbell.Visitee.create
+        class First(object):
+            pass
+
+        @doorbell.Visitee.create
+        class Second(object):
+            pass
+
+        assert Second._tag == First._tag + 1
+
+    def test_collected(self):
+        @doorbell.Visitee.create
+        class Temporary(object):
+            pass
+
+        tag = Temporary._tag
+        del Temporary
+        gc.collect()
+        with pytest.raises(KeyError):
+            doorbell.Visitee.tagged_class(tag)
+
+    def test_instance_tag(self):
+        v = self.Visitor()
+        node = self.Value()
+        node._tag = self.Auto._tag
+        assert v.dispatch(node) == 'Value'
+        node._tag = 'tag'
+        assert v.dispatch(node) == 'Value'
+
+    def test_register(self):
+        class Base(object):
+            pass
+
+        class Registered(Base):
+            def accept(self, visitor):
+                return visitor.visit_Value(self)
+
+        doorbell.Visitee.register(Registered)
+        assert '_tag' not in vars(Registered)
+        with pytest.raises(ValueError):
+            doorbell.Visitee.type_tag(Registered)
+        assert '__init_subclass__' not in vars(Registered)
+        assert isinstance(Registered(), doorbell.Visitee)
+        assert self.Visitor().dispatch(Registered()) == 'Registered'
+
+    def test_subclass_before_base(self):
+        class Base(object):
+            pass
+
+        class Child(Base):
+            def accept(self, visitor):
+                return visitor.visit_Auto(self)
+
+        doorbell.Visitee.create('Value', inplace=True)(Base)
+        assert '_tag' not in vars(Child)
+        v = self.Visitor()
+        assert v.dispatch(Base()) == 'Base'
+        assert v.dispatch(Child()) == 'Child'
+
+    def test_dispatch(self):
+        v = self.Visitor()
+        for cls in self.classes:
+            node = cls()
+            assert v.dispatch(node) == cls.__name__
+
+
+class Animal(object):
+    pass
+
+
+class Dog(Animal):
+    pass
+
+
+class Puppy(Dog):
+    pass
+
+
+class TestTypeDispatch:
+    @doorbell.Visitee.create
+    class Value(object):
+        pass
+
+    @doorbell.Visitee.create
+    class Value2(Value):
+        pass
+
+    class Visitor(doorbell.Visitor):
+        @doorbell.Visitor.visits(Animal)
+        def animal(self, obj):
+            return 'animal'
+
+        def visit_Value(self, obj):
+            return 'Value'
+
+    class Generic(Visitor):
+        def generic_visit(self, obj):
+            return 'generic'
+
+    def test_exact(self):
+        assert self.Visitor().dispatch(Animal()) == 'animal'
+
+    def test_ancestor(self):
+        v = self.Visitor()
+        assert v.dispatch(Puppy()) == 'animal'
+        assert v.dispatch(self.Value2()) == 'Value'
+        assert self.Value2().accept(v) == 'Value'
+
+    def test_generic(self):
+        v = self.Generic()
+        assert v.dispatch(1) == 'generic'
+        assert v.dispatch(Dog()) == 'animal'
+
+        @doorbell.Visitee.create('Unknown')
+        class Other(object):
+            pass
+
+        assert Other().accept(v) == v.dispatch(Other()) == 'generic'
+
+    def test_missing(self):
+        with pytest.raises(AttributeError):
+            self.Visitor().dispatch(1)
+
+    def test_register(self):
+        class Registering(self.Generic):
+            pass
+
+        v = Registering()
+        assert v.dispatch(Dog()) == 'animal'
+        assert v.dispatch(1) == 'generic'
+
+        def dog(self, obj):
+            return 'dog'
+
+        Registering.register_type(Dog, dog)
+        assert v.dispatch(Puppy()) == 'dog'
+        assert v.dispatch(Animal()) == 'animal'
+        assert self.Visitor().dispatch(Dog()) == 'animal'
+
+    def test_cascading(self):
+        class Cascading(doorbell.CascadingVisitor):
+            @doorbell.Visitor.visits(list)
+            def sequence(self, obj, children):
+                return sum(children)
+
+            @doorbell.Visitor.visits(int)
+            def number(self, obj, children):
+                return obj
+
+            def _gather_children(self, subject):
+                return subject if isinstance(subject, list) else []
+
+        tree = [1, [2, 3], [[4]]]
+        assert Cascading().dispatch(tree) == 10
+
+
+class Number(object):
+    pass
+
+
+class Int(Number):
+    pass
+
+
+class Float(Number):
+    pass
+
+
+class TestMultimethod:
+    class Visitor(doorbell.Visitor):
+        @doorbell.Visitor.multimethod(Int, Int)
+        def visit_Add(self, left, right):
+            return 'Int'
+
+        @visit_Add.register(Number, Float)
+        @visit_Add.register(Float, Number)
+        def visit_Add(self, left, right):
+            return 'Float'
+
+        @visit_Add.register(Number, Number)
+        def visit_Add(self, left, right):
+            return 'Number'
+
+        @doorbell.Visitor.multimethod(Number)
+        def describe(self, value, suffix=''):
+            return 'number' + suffix
+
+    class Wrapping(Visitor, doorbell.WrappingVisitor):
+        def _wrap_all_post(self, arg):
+            return arg.lower()
+
+    def test_exact(self):
+        v = self.Visitor()
+        assert v.visit_Add(Int(), Int()) == 'Int'
+        assert v.visit_Add(Number(), Number()) == 'Number'
+
+    def test_nearest(self):
+        v = self.Visitor()
+        assert v.visit_Add(Int(), Float()) == 'Float'
+        assert v.visit_Add(Float(), Int()) == 'Float'
+
+    def test_ambiguity(self):
+        class Ambiguous(doorbell.Visitor):
+            @doorbell.Visitor.multimethod(Float, Number)
+            def visit_Add(self, left, right):
+                return 'left'
+
+            @visit_Add.register(Number, Float)
+            def visit_Add(self, left, right):
+                return 'right'
+
+        # both match; the first argument decides
+        v = Ambiguous()
+        assert v.visit_Add(Float(), Float()) == 'left'
+        assert v.visit_Add(Int(), Float()) == 'right'
+
+    def test_cache(self):
+        v = self.Visitor()
+        method = vars(self.Visitor)['visit_Add'].function
+        v.visit_Add(Int(), Int())
+        assert (Int, Int) in method._cache
+
+    def test_extra_arguments(self):
+        v = self.Visitor()
+        assert v.describe(Int(), suffix='!') == 'number!'
+        assert v.describe(Float(), '?') == 'number?'
+
+    def test_no_match(self):
+        with pytest.raises(TypeError):
+            self.Visitor().visit_Add(1, 2)
+
+    def test_arity(self):
+        method = vars(self.Visitor)['visit_Add'].function
+        with pytest.raises(ValueError):
+            @method.register(Int)
+            def visit_Add(self, left):
+                pass
+
+    def test_wrapping(self):
+        assert self.Wrapping().visit_Add(Int(), Int()) == 'int'
@@ -0,0 +1,143 @@
+import doorbell
+import pytest
+
+
+@doorbell.Visitee.create
+class Num(object):
+    def __init__(self, value, *children):
+        self.value = value
+        self.children = list(children)
+
+
+@doorbell.Visitee.create
+class Neg(Num):
+    pass
+
+
+class Opaque(Num):
+    def accept(self, visitor, *args):
+        return visitor.visit_Num(self, *args)
+
+
+class Sum(doorbell.BatchingVisitor):
+    def __init__(self):
+        super(Sum, self).__init__()
+        self.calls = []
+
+    def visit_Num(self, subject, children, extra=0):
+        self.calls.append(('Num', subject.value))
+        return subject.value + sum(children) + extra
+
+    def visit_Neg(self, subject, children):
+        self.calls.append(('Neg', subject.value))
+        return -sum(children)
+
+
+class BatchSum(Sum):
+    def visit_batch_Num(self, subjects, children):
+        self.calls.append(('batch', [s.value for s in subjects]))
+        return [s.value + sum(c) for s, c in zip(subjects, children)]
+
+
+def tree():
+    return Num(1, Num(2, Num(3), Num(4)), Neg(0, Num(5)), Num(6))
+
+
+def test_per_node():
+    visitor = Sum()
+    assert visitor.dispatch(tree()) == 1 + 2 + 3 + 4 - 5 + 6
+    assert len(visitor.calls) == 7
+    assert not visitor._visiting
+
+
+def test_batches():
+    visitor = BatchSum()
+    assert visitor.dispatch(tree()) == 11
+    assert visitor.calls == [
+        ('batch', [3, 4, 5, 6]),
+        ('batch', [2]),
+        ('Neg', 0),
+        ('Num', 1)]
+
+
+def test_root_args():
+    assert BatchSum().visit_Num(tree(), 100) == 111
+
+
+def test_shared():
+    shared = Num(3)
+    visitor = BatchSum()
+    assert visitor.dispatch(Num(0, shared, Num(1, shared))) == 7
+    assert visitor.calls[0] == ('batch', [3])
+
+
+def test_opaque():
+    visitor = BatchSum()
+    assert visitor.dispatch(Num(1, Opaque(2, Num(3)))) == 6
+
+
+def test_aliased():
+    class Aliased(BatchSum):
+        visit_Neg = Sum.visit_Num
+
+        def visit_batch_Neg(self, subjects, children):
+            self.calls.append(('batch Neg', [s.value for s in subjects]))
+            return [-sum(c) for c in children]
+
+    visitor = Aliased()
+    assert visitor.dispatch(Num(1, Num(2), Neg(0, Num(3)))) == 1 + 2 - 3
+    assert visitor.calls == [
+        ('batch', [2, 3]),
+        ('batch Neg', [0]),
+        ('Num', 1)]
+
+
+def test_registered():
+    class Registered(doorbell.BatchingVisitor):
+        visit_Num = Sum.visit_Num.function
+
+    def visit_Neg(self, subject, children):
+        return -sum(children)
+
+    visitor = Registered()
+    visitor.calls = []
+    assert visitor.dispatch(Num(1, Neg(2, Num(3)))) == 6
+    Registered.register_type(Neg, visit_Neg)
+    assert visitor.dispatch(Num(1, Neg(2, Num(3)))) == -2
+
+
+def test_kind():
+    class Kinds(doorbell.BatchingVisitor):
+        kind_key = 'kind'
+        children_key = 'args'
+
+        def visit_num(self, subject, children):
+            return subject['value']
+
+        def visit_batch_num(self, subjects, children):
+            return [s['value'] * 10 for s in subjects]
+
+        def visit_add(self, subject, children):
+            return sum(children)
+
+    data = {'kind': 'add', 'args': [{'kind': 'num', 'value': 1},
+                                    {'kind': 'num', 'value': 2}]}
+    assert Kinds().dispatch(data) == 30
+
+
+def test_wrong_length():
+    class Broken(Sum):
+        def visit_batch_Num(self, subjects, children):
+            return []
+
+    with pytest.raises(ValueError):
+        Broken().dispatch(tree())
+
+
+def test_deep():
+    tree = node = Num(0)
+    for i in range(5000):
+        child = Num(1)
+        node.children.append(child)
+        node = child
+    assert BatchSum().dispatch(tree) == 5000
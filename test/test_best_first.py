@@ -0,0 +1,106 @@
+import doorbell
+
+
+@doorbell.Visitee.create
+class Plan(object):
+    def __init__(self, cost, *children):
+        self.cost = cost
+        self.children = list(children)
+
+
+class Opaque(Plan):
+    def accept(self, visitor, *args):
+        return visitor.visit_Plan(self, *args)
+
+
+class Cheapest(doorbell.BestFirstVisitor):
+    def __init__(self):
+        super(Cheapest, self).__init__()
+        self.visited = []
+
+    def _priority(self, subject):
+        return subject.cost
+
+    def _bound(self, subject):
+        return subject.cost
+
+    def visit_Plan(self, subject, offset=0):
+        self.visited.append(subject.cost)
+        if not subject.children:
+            return subject.cost + offset
+
+
+def tree():
+    return Plan(0,
+                Plan(5, Plan(6), Plan(9)),
+                Plan(1, Plan(3), Opaque(2, Plan(4))),
+                Plan(7))
+
+
+def scores(results):
+    return [score for score, node in results]
+
+
+def test_best():
+    visitor = Cheapest()
+    assert scores(visitor.dispatch(tree())) == [3]
+    # 4, 5, 7 and their descendants cannot beat 3
+    assert visitor.visited == [0, 1, 2, 3]
+    assert not visitor.exhausted and not visitor._visiting
+
+
+def test_keep():
+    class Three(Cheapest):
+        keep = 3
+
+    visitor = Three()
+    assert scores(visitor.dispatch(tree())) == [3, 4, 6]
+    assert 9 not in visitor.visited
+
+
+def test_budget():
+    class Budget(Cheapest):
+        keep = 3
+        budget = 5
+
+    visitor = Budget()
+    assert scores(visitor.dispatch(tree())) == [3, 4]
+    assert visitor.visited == [0, 1, 2, 3, 4]
+    assert visitor.exhausted
+
+    class Tiny(Cheapest):
+        budget = 2
+
+    visitor = Tiny()
+    assert visitor.dispatch(tree()) == []
+    assert visitor.exhausted
+
+
+def test_no_bound():
+    class Unbounded(Cheapest):
+        keep = 10
+
+        def _bound(self, subject):
+            return None
+
+    visitor = Unbounded()
+    assert scores(visitor.dispatch(tree())) == [3, 4, 6, 7, 9]
+    assert visitor.visited == [0, 1, 2, 3, 4, 5, 6, 7, 9]
+
+
+def test_default_order():
+    class Fifo(doorbell.BestFirstVisitor):
+        def __init__(self):
+            super(Fifo, self).__init__()
+            self.visited = []
+
+        def visit_Plan(self, subject):
+            self.visited.append(subject.cost)
+
+    visitor = Fifo()
+    assert visitor.dispatch(tree()) == []
+    assert visitor.visited == [0, 5, 1, 7, 6, 9, 3, 2, 4]
+
+
+def test_root_args():
+    assert scores(Cheapest().visit_Plan(Plan(1), 10)) == [11]
@@ -0,0 +1,102 @@
+import doorbell
+
+
+@doorbell.Visitee.create
+class Tree(object):
+    def __init__(self, name, *children):
+        self.name = name
+        self.children = list(children)
+
+
+class Opaque(Tree):
+    def accept(self, visitor, *args):
+        return visitor.visit_Tree(self, *args)
+
+
+class Names(doorbell.BreadthFirstVisitor):
+    def __init__(self):
+        super(Names, self).__init__()
+        self.entered = []
+
+    def _enter_level(self, frontier, depth):
+        self.entered.append((depth, [n.name for n in frontier]))
+
+    def visit_Tree(self, subject, suffix=''):
+        return subject.name + suffix
+
+
+def tree():
+    return Tree('a',
+                Tree('b', Tree('d'), Tree('e', Tree('g'))),
+                Opaque('c', Tree('f')))
+
+
+def test_levels():
+    visitor = Names()
+    assert list(visitor.dispatch(tree())) == [
+        ['a'], ['b', 'c'], ['d', 'e', 'f'], ['g']]
+    assert visitor.entered == [
+        (0, ['a']), (1, ['b', 'c']), (2, ['d', 'e', 'f']), (3, ['g'])]
+    assert not visitor._visiting
+
+
+def test_incremental():
+    visitor = Names()
+    levels = visitor.dispatch(tree())
+    assert visitor.entered == []
+    assert next(levels) == ['a']
+    assert visitor.entered == [(0, ['a'])]
+    assert not visitor._visiting
+    assert next(levels) == ['b', 'c']
+    assert visitor.entered[-1] == (1, ['b', 'c'])
+
+
+def test_binding():
+    visitor = Names()
+    assert visitor.visit_Tree.func == visitor._levels
+
+
+def test_root_args():
+    levels = Names().visit_Tree(tree(), '!')
+    assert [next(levels), next(levels)] == [['a!'], ['b', 'c']]
+
+
+def test_max_depth():
+    class Shallow(Names):
+        max_depth = 1
+
+    assert list(Shallow().dispatch(tree())) == [['a'], ['b', 'c']]
+
+    class Root(Names):
+        max_depth = 0
+
+    assert list(Root().dispatch(tree())) == [['a']]
+
+
+def test_frontiers():
+    visited = []
+
+    class Lazy(doorbell.Visitor):
+        def _gather_children(self, subject):
+            visited.append(subject.name)
+            return subject.children
+
+    frontiers = Lazy().frontiers(tree())
+    assert [n.name for n in next(frontiers)] == ['a']
+    assert visited == []
+    assert [n.name for n in next(frontiers)] == ['b', 'c']
+    assert visited == ['a']
+    assert len(list(Lazy().frontiers(tree(), depth=2))) == 3
+
+
+def test_kind():
+    class Kinds(doorbell.BreadthFirstVisitor):
+        kind_key = 'kind'
+        children_key = 'args'
+
+        def generic_visit(self, subject):
+            return subject['kind']
+
+    data = {'kind': 'add', 'args': [{'kind': 'num'}, {'kind': 'neg', 'args':
+                                                      [{'kind': 'num'}]}]}
+    assert list(Kinds().dispatch(data)) == [['add'], ['num', 'neg'], ['num']]
@@ -1,6 +1,8 @@
 import doorbell
 import functools
 import operator
+import pytest
+import weakref
 
 
 @doorbell.Visitee.create
@@ -39,6 +41,47 @@ class Visitor(doorbell.CascadingVisitor):
         return len(args)
 
 
+class Kinded(Value):
+    """chooses its visitor method from its own state"""
+    def __init__(self, kind, *children):
+        super(Kinded, self).__init__()
+        self.kind = kind
+        self.children = list(children)
+
+    def accept(self, visitor, *args):
+        return getattr(visitor, 'visit_' + self.kind)(self, *args)
+
+
+class Scaled(Value):
+    """passes an extra argument to its visitor method"""
+    def accept(self, visitor, *args):
+        return visitor.visit_Scaled(self, self.value, *args)
+
+
+class Quiet(Value):
+    """reads an attribute of the visitor"""
+    def accept(self, visitor, *args):
+        if visitor.verbose:
+            return visitor.visit_Value(self, *args)
+        return visitor.visit_Quiet(self, *args)
+
+
+class AcceptVisitor(Visitor):
+    verbose = False
+
+    def visit_A(self, obj, children):
+        return ['A'] + children
+
+    def visit_B(self, obj, children):
+        return ['B'] + children
+
+    def visit_Scaled(self, obj, children, factor):
+        return factor * sum(children)
+
+    def visit_Quiet(self, obj, children):
+        return 'quiet'
+
+
 class TestVisitee:
     def test_add(self):
         one = Value(1)
@@ -68,8 +111,604 @@ class TestVisitee:
         r = mult.accept(v)
         assert r == 4
 
+    def test_missing_method(self):
+        class AddOnly(doorbell.CascadingVisitor):
+            def visit_Add(self, obj, children):
+                return ['Add'] + children
+
+        class IterativeAddOnly(AddOnly):
+            iterative = True
+
+        mult = Mult()
+        add = Add()
+        add.children.append(mult)
+        for v in (AddOnly(), IterativeAddOnly()):
+            # Mult calls visit_Multiply, and falls back to its base class
+            assert mult.accept(v) == ['Add']
+            assert add.accept(v) == ['Add', ['Add']]
+        add.children.append(Value(1))
+        for v in (AddOnly(), IterativeAddOnly()):
+            with pytest.raises(AttributeError):
+                Value(1).accept(v)
+            with pytest.raises(AttributeError):
+                add.accept(v)
+
     def test_many_arguments(self):
         """visitor method should receive all additional arguments"""
         m = ManyArgs()
         v = Visitor()
         assert m.accept(v, 1, 2, 3) == 3
+
+    def test_accept_state(self):
+        tree = Kinded('A', Kinded('A'), Kinded('B'))
+        assert tree.accept(AcceptVisitor()) == ['A', ['A'], ['B']]
+
+    def test_accept_arguments(self):
+        scaled = Scaled(3)
+        scaled.children.extend((Value(1), Scaled(2)))
+        scaled.children[1].children.append(Value(5))
+        root = Add()
+        root.children.append(scaled)
+        assert root.accept(AcceptVisitor()) == 3 * (1 + 2 * 5)
+
+    def test_accept_visitor_attribute(self):
+        tree = Kinded('A', Quiet(1), Value(2))
+        v = AcceptVisitor()
+        assert tree.accept(v) == ['A', 'quiet', 2]
+        v.verbose = True
+        assert tree.accept(v) == ['A', 1, 2]
+
+
+class IterativeVisitor(Visitor):
+    iterative = True
+
+
+class IterativeAcceptVisitor(AcceptVisitor):
+    iterative = True
+
+
+class TestIterative:
+    def test_combined(self):
+        one = Value(1)
+        add = Add()
+        add.children.extend((one, one))
+        mult = Mult()
+        mult.children.extend((add, add, Value(3)))
+        assert mult.accept(IterativeVisitor()) == mult.accept(Visitor())
+
+    def test_many_arguments(self):
+        m = ManyArgs()
+        m.children.append(ManyArgs())
+        assert m.accept(IterativeVisitor(), 1, 2, 3) == 3
+
+    def test_deep(self):
+        root = Add()
+        node = root
+        for i in range(5000):
+            child = Add()
+            node.children.extend((child, Value(1)))
+            node = child
+        assert root.accept(IterativeVisitor()) == 5000
+
+    def test_wrap_each_post(self):
+        class Counting(IterativeVisitor):
+            def _wrap_each_post(self, arg):
+                return arg + 1
+
+        one = Value(1)
+        add = Add()
+        add.children.extend((one, one))
+        assert add.accept(Counting()) == 5
+
+    def test_wrap_each_pre(self):
+        class Extra(Visitor):
+            def __init__(self):
+                super(Extra, self).__init__()
+                self.calls = []
+
+            def _wrap_each_pre(self, subject, *args):
+                return super(Extra, self)._wrap_each_pre(subject, 'extra',
+                                                         *args)
+
+            def visit_Value(self, obj, children, *args):
+                self.calls.append(args)
+                return obj.value
+
+            def visit_Add(self, obj, children, *args):
+                self.calls.append(args)
+                return sum(children)
+
+        class IterativeExtra(Extra):
+            iterative = True
+
+        class MemoizedExtra(Extra):
+            memoize = True
+
+        instance = Extra()
+        instance.iterative = True
+        add = Add()
+        add.children.extend((Value(1), Value(2)))
+        expected = Extra()
+        assert add.accept(expected) == 3
+        assert expected.calls == [('extra',)] * 3
+        for v in (IterativeExtra(), MemoizedExtra(), instance):
+            assert add.accept(v) == 3
+            assert v.calls == expected.calls
+
+    def test_instance_option(self):
+        root = node = Add()
+        for i in range(3000):
+            child = Add()
+            node.children.extend((child, Value(1)))
+            node = child
+        v = Visitor()
+        v.iterative = True
+        assert root.accept(v) == 3000
+
+    def test_instance_option_after_visit(self):
+        root = node = Add()
+        for i in range(3000):
+            child = Add()
+            node.children.extend((child, Value(1)))
+            node = child
+        v = Visitor()
+        assert Value(2).accept(v) == 2
+        v.iterative = True
+        assert root.accept(v) == 3000
+        v.iterative = False
+        # RecursionError, from Python 3.5
+        with pytest.raises(RuntimeError):
+            root.accept(v)
+
+    def test_reentrant(self):
+        one = Value(1)
+        add = Add()
+        add.children.extend((one, one))
+        v = IterativeVisitor()
+        assert add.accept(v) == 2
+        assert not v._visiting
+        assert add.accept(v) == 2
+
+    def test_accept_state(self):
+        tree = Kinded('A', Kinded('A'), Kinded('B'))
+        assert tree.accept(IterativeAcceptVisitor()) == ['A', ['A'], ['B']]
+
+    def test_accept_arguments(self):
+        scaled = Scaled(3)
+        scaled.children.extend((Value(1), Scaled(2)))
+        scaled.children[1].children.append(Value(5))
+        root = Add()
+        root.children.append(scaled)
+        assert root.accept(IterativeAcceptVisitor()) == 3 * (1 + 2 * 5)
+
+    def test_accept_visitor_attribute(self):
+        tree = Kinded('A', Quiet(1), Value(2))
+        v = IterativeAcceptVisitor()
+        assert tree.accept(v) == ['A', 'quiet', 2]
+        v.verbose = True
+        assert tree.accept(v) == ['A', 1, 2]
+
+
+class TestMemoize:
+    class Counting(Visitor):
+        memoize = True
+
+        def __init__(self):
+            super(TestMemoize.Counting, self).__init__()
+            self.calls = 0
+
+        def visit_Add(self, obj, children):
+            self.calls += 1
+            return sum(children)
+
+    def test_combined(self):
+        one = Value(1)
+        add = Add()
+        add.children.extend((one, one))
+        mult = Mult()
+        mult.children.extend((add, add))
+        v = self.Counting()
+        assert mult.accept(v) == 4
+        assert v.calls == 1
+        assert mult.accept(v) == 4
+        assert v.calls == 2
+
+    def test_exponential(self):
+        node = Value(1)
+        for i in range(64):
+            parent = Add()
+            parent.children.extend((node, node))
+            node = parent
+        v = self.Counting()
+        assert node.accept(v) == 2 ** 64
+        assert v.calls == 64
+
+    def test_released(self):
+        class Result(object):
+            def __init__(self, value):
+                self.value = value
+
+        class Tracking(Visitor):
+            memoize = True
+
+            def __init__(self):
+                super(Tracking, self).__init__()
+                self.results = []
+                self.peak = 0
+
+            def _result(self, value):
+                alive = [r for r in self.results if r() is not None]
+                self.peak = max(self.peak, len(alive))
+                result = Result(value)
+                self.results = alive + [weakref.ref(result)]
+                return result
+
+            def visit_Value(self, obj, children):
+                return self._result(obj.value)
+
+            def visit_Add(self, obj, children):
+                return self._result(sum(c.value for c in children))
+
+        node = Value(1)
+        for i in range(64):
+            parent = Add()
+            parent.children.extend((node, node, Value(0)))
+            node = parent
+        v = Tracking()
+        assert node.accept(v).value == 2 ** 64
+        # only the results of the children of the visitee being visited
+        assert v.peak <= 3
+
+    def test_consume(self):
+        counts = {1: 2}
+        memo = {}
+        assert doorbell._consume(counts, memo, 1, 'result') == 'result'
+        assert counts == {1: 1} and memo == {1: 'result'}
+        doorbell._consume(counts, memo, 1, 'result')
+        assert counts == {} and memo == {}
+
+    def test_instance_option(self):
+        class Counting(self.Counting):
+            memoize = False
+
+        node = Value(1)
+        for i in range(10):
+            parent = Add()
+            parent.children.extend((node, node))
+            node = parent
+        v = Counting()
+        assert node.accept(v) == 2 ** 10
+        assert v.calls == 2 ** 10 - 1
+        v.calls = 0
+        v.memoize = True
+        assert node.accept(v) == 2 ** 10
+        assert v.calls == 10
+
+    def test_shared_levels(self):
+        shared = Value(2)
+        left = Add()
+        left.children.extend((shared, shared))
+        right = Mult()
+        right.children.extend((left, shared))
+        root = Add()
+        root.children.extend((left, right, shared))
+        v = self.Counting()
+        assert root.accept(v) == root.accept(Visitor()) == 14
+        assert v.calls == 2
+
+
+class KindVisitor(doorbell.CascadingVisitor):
+    kind_key = 'kind'
+    children_key = 'args'
+
+    def visit_num(self, obj, children):
+        return obj['value']
+
+    def visit_add(self, obj, children):
+        return sum(children)
+
+    def visit_mul(self, obj, children):
+        return functools.reduce(operator.mul, children, 1)
+
+
+def payload():
+    one = {'kind': 'num', 'value': 1}
+    two = {'kind': 'num', 'value': 2}
+    add = {'kind': 'add', 'args': [one, two]}
+    return {'kind': 'mul', 'args': [add, add, {'kind': 'num', 'value': 3}]}
+
+
+class TestKind:
+    def test_dict(self):
+        v = KindVisitor()
+        assert v.dispatch(payload()) == 27
+        assert sorted(v._kinds) == ['add', 'mul', 'num']
+
+    def test_iterative(self):
+        class Iterative(KindVisitor):
+            memoize = True
+
+        v = Iterative()
+        assert v.dispatch(payload()) == 27
+        assert sorted(Iterative._kind_table) == ['add', 'num']
+
+    def test_tuple(self):
+        class TupleVisitor(doorbell.CascadingVisitor):
+            kind_key = 0
+            children_key = slice(1, None)
+
+            def visit_add(self, obj, children):
+                return sum(children)
+
+            @doorbell.Visitor.visits(int)
+            def number(self, obj, children):
+                return obj
+
+            def _gather_children(self, subject):
+                if isinstance(subject, int):
+                    return ()
+                return super(TupleVisitor, self)._gather_children(subject)
+
+        tree = ('add', 1, ('add', 2, 3), ('add',))
+        assert TupleVisitor().dispatch(tree) == 6
+
+    def test_wrapping(self):
+        class Wrapping(KindVisitor):
+            def _wrap_each_post(self, arg):
+                return arg * 10
+
+        tree = {'kind': 'add', 'args': [{'kind': 'num', 'value': 1}]}
+        assert Wrapping().dispatch(tree) == 100
+
+    def test_generic(self):
+        class Generic(KindVisitor):
+            def generic_visit(self, obj, children):
+                return obj['kind']
+
+        tree = {'kind': 'other'}
+        assert Generic().dispatch(tree) == 'other'
+        with pytest.raises(AttributeError):
+            KindVisitor().dispatch(tree)
+
+
+class OpaqueAdd(Add):
+    def accept(self, visitor, *args):
+        return visitor.visit_Add(self, *args)
+
+
+class PruningVisitor(Visitor):
+    """skips values of zero and stops at negative values"""
+    def __init__(self):
+        super(PruningVisitor, self).__init__()
+        self.visited = []
+
+    def _pre_visit(self, subject):
+        self.visited.append(subject)
+        if subject.value == 0 and not subject.children:
+            return doorbell.SKIP, 100
+        if subject.value < 0:
+            return doorbell.STOP, subject.value
+
+
+class TestPrune:
+    def test_skip(self):
+        add = Add()
+        add.children.extend((Value(1), Value(0), Value(2)))
+        assert add.accept(PruningVisitor()) == 103
+
+    def test_skip_subtree(self):
+        skipped = Add(-1)
+        skipped.children.append(Value(5))
+
+        class SkipAdds(PruningVisitor):
+            def _pre_visit(self, subject):
+                if subject is skipped:
+                    return doorbell.SKIP, 10
+
+        add = Add()
+        add.children.extend((Value(1), skipped))
+        assert add.accept(SkipAdds()) == 11
+
+    def test_stop(self):
+        add = Add()
+        add.children.extend((Value(1), Value(-3), Value(2)))
+        outer = Mult()
+        outer.children.extend((add, Value(4)))
+        visitor = PruningVisitor()
+        assert outer.accept(visitor) == -3
+        assert len(visitor.visited) == 4
+        assert not visitor._visiting and visitor._stop is None
+        # the visitor may be used again
+        assert Value(7).accept(visitor) == 7
+
+    def test_stop_root(self):
+        assert Value(-1).accept(PruningVisitor()) == -1
+
+    def test_stop_nested(self):
+        opaque = OpaqueAdd()
+        opaque.children.extend((Value(1), Value(-5)))
+        add = Add()
+        add.children.extend((opaque, Value(2)))
+        visitor = PruningVisitor()
+        assert add.accept(visitor) == -5
+        assert len(visitor.visited) == 4
+
+    def test_stop_deep(self):
+        root = node = Add()
+        for i in range(10000):
+            child = Add()
+            node.children.append(child)
+            node = child
+        node.children.append(Value(-2))
+        assert root.accept(PruningVisitor()) == -2
+
+    def test_post(self):
+        class Post(PruningVisitor):
+            def _wrap_each_post(self, arg):
+                return arg * 2
+
+        add = Add()
+        add.children.extend((Value(1), Value(0)))
+        assert add.accept(Post()) == (2 + 100) * 2
+
+    def test_wrap_each_pre(self):
+        class Both(PruningVisitor):
+            def _wrap_each_pre(self, *args):
+                return super(Both, self)._wrap_each_pre(*args)
+
+        with pytest.raises(TypeError):
+            Value(1).accept(Both())
+
+    @pytest.mark.parametrize('signal', ['skip it', 'SKIP', 'STOP'])
+    def test_invalid(self, signal):
+        class Invalid(Visitor):
+            def _pre_visit(self, subject):
+                return signal, None
+
+        with pytest.raises(ValueError):
+            Value(1).accept(Invalid())
+
+
+class LazyVisitor(Visitor):
+    lazy = True
+
+    def __init__(self):
+        super(LazyVisitor, self).__init__()
+        self.visited = 0
+
+    def visit_Value(self, obj, children):
+        self.visited += 1
+        return obj.value
+
+    def visit_Add(self, obj, children):
+        self.visited += 1
+        return functools.reduce(operator.add, children, 0)
+
+
+class Or(Value):
+    def accept(self, visitor, *args):
+        return visitor.visit_Or(self, *args)
+
+
+class ShortCircuit(LazyVisitor):
+    def visit_Or(self, obj, children):
+        return any(children)
+
+
+def tree():
+    one = Value(1)
+    add = Add()
+    add.children.extend((one, Value(2)))
+    mult = Mult()
+    mult.children.extend((add, add, Value(3)))
+    return mult
+
+
+class TestLazy:
+    def test_matches_eager(self):
+        assert tree().accept(LazyVisitor()) == tree().accept(Visitor())
+
+    def test_short_circuit(self):
+        node = Or()
+        node.children.extend((Value(0), Value(1), Value(2), Value(3)))
+        visitor = ShortCircuit()
+        assert node.accept(visitor) is True
+        assert visitor.visited == 2
+
+    def test_skip(self):
+        class Second(LazyVisitor):
+            def visit_Add(self, obj, children):
+                children.skip()
+                return next(children)
+
+        add = Add()
+        add.children.extend((Value(1), Value(2), Value(3)))
+        visitor = Second()
+        assert add.accept(visitor) == 2
+        assert visitor.visited == 1
+
+    def test_streaming(self):
+        class Stream(LazyVisitor):
+            def _gather_children(self, subject):
+                if isinstance(subject, Add):
+                    return (Value(i) for i in range(100000))
+                return ()
+
+        assert Add().accept(Stream()) == sum(range(100000))
+
+    def test_post(self):
+        class Post(LazyVisitor):
+            def _wrap_each_post(self, arg):
+                return arg + 1
+
+        class EagerPost(Visitor):
+            _wrap_each_post = Post._wrap_each_post
+
+        assert tree().accept(Post()) == tree().accept(EagerPost()) == 145
+
+    def test_wrapper(self):
+        class Wrapped(LazyVisitor):
+            def _visit_wrapper(self, *args, **kwargs):
+                return super(Wrapped, self)._visit_wrapper(*args, **kwargs)
+
+        assert tree().accept(Wrapped()) == 27
+
+    def test_overrides_iterative(self):
+        class Both(LazyVisitor):
+            iterative = True
+
+        assert tree().accept(Both()) == 27
+
+
+class TestEstimate:
+    def random_tree(self, seed, depth):
+        import random
+        rng = random.Random(seed)
+
+        def build(depth):
+            if depth == 0 or rng.random() < 0.2:
+                return Value(rng.randint(0, 9))
+            add = Add()
+            add.children.extend(build(depth - 1)
+                                for i in range(rng.randint(1, 4)))
+            return add
+        return build(depth)
+
+    def test_balanced(self):
+        add = Add()
+        add.children.extend((Value(1), Value(2)))
+        estimate = Visitor().estimate(add, samples=50, seed=1)
+        # each path gives 2 * 1 or 2 * 2
+        assert 2 <= estimate.low <= estimate.value <= estimate.high <= 4
+
+    def test_exact(self):
+        tree = self.random_tree(0, 8)
+        exact = tree.accept(IterativeVisitor())
+        estimate = IterativeVisitor().estimate(tree, samples=2000, seed=3)
+        assert estimate.low <= exact <= estimate.high
+        assert estimate.error > 0
+
+    def test_reproducible(self):
+        tree = self.random_tree(4, 6)
+        first = Visitor().estimate(tree, seed=7)
+        assert Visitor().estimate(tree, seed=7) == first
+        assert Visitor().estimate(tree, seed=8) != first
+
+    def test_one_sample(self):
+        estimate = Visitor().estimate(Value(3), samples=1)
+        assert estimate.value == 3
+        assert estimate.low == float('-inf') and estimate.high == float('inf')
+
+    def test_no_samples(self):
+        for samples in (0, -1):
+            with pytest.raises(ValueError):
+                Visitor().estimate(Value(3), samples=samples)
+
+    def test_opaque(self):
+        class OpaqueCount(Value):
+            def accept(self, visitor, *args):
+                return 10
+
+        add = Add()
+        add.children.append(OpaqueCount())
+        assert Visitor().estimate(add, samples=3).value == 10
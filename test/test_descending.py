@@ -0,0 +1,119 @@
+import doorbell
+import pytest
+
+
+@doorbell.Visitee.create
+class Block(object):
+    def __init__(self, *children, **names):
+        self.children = list(children)
+        self.names = names
+
+
+@doorbell.Visitee.create
+class Use(object):
+    children = ()
+
+    def __init__(self, name):
+        self.name = name
+
+
+class Opaque(Use):
+    def accept(self, visitor, *args):
+        return visitor.visit_Use(self, *args)
+
+
+class Resolve(doorbell.DescendingVisitor):
+    def __init__(self):
+        super(Resolve, self).__init__()
+        self.found = []
+        self.paths = []
+
+    def visit_Block(self, subject, scope):
+        return scope.child(subject.names)
+
+    def visit_Use(self, subject, scope):
+        self.found.append(scope.get(subject.name))
+        self.paths.append(self.path)
+
+
+def test_scopes():
+    tree = Block(Use('x'),
+                 Block(Use('x'), Use('y'), x=3),
+                 Use('y'),
+                 x=1, y=2)
+    visitor = Resolve()
+    scope = visitor.dispatch(tree, doorbell.Scope())
+    assert scope.bindings == {'x': 1, 'y': 2}
+    assert visitor.found == [1, 3, 2, 2]
+
+
+def test_path():
+    leaf = Use('x')
+    inner = Block(leaf)
+    tree = Block(inner)
+    visitor = Resolve()
+    visitor.visit_Block(tree, doorbell.Scope())
+    path, = visitor.paths
+    assert list(path) == [leaf, inner, tree]
+    assert path.depth == 2 and len(path) == 3
+    assert path.parent.node is inner
+    assert visitor.path is None and not visitor._visiting
+
+
+def test_none_passes_context():
+    class Count(doorbell.DescendingVisitor):
+        def visit_Block(self, subject, depth):
+            if subject.names:
+                return depth + 1
+
+        def visit_Use(self, subject, depth):
+            subject.depth = depth
+
+    leaf = Use('x')
+    Count().dispatch(Block(Block(Block(leaf), x=1)), 0)
+    assert leaf.depth == 1
+
+
+def test_opaque_visitee():
+    visitor = Resolve()
+    visitor.dispatch(Block(Opaque('x'), x=1), doorbell.Scope())
+    assert visitor.found == [1]
+
+
+def test_binding():
+    visitor = Resolve()
+    assert visitor.visit_Block.func == visitor._descend
+
+    class Wrapped(Resolve):
+        def _visit_wrapper(self, *args, **kwargs):
+            self.paths.append('wrapped')
+            return super(Wrapped, self)._visit_wrapper(*args, **kwargs)
+
+    visitor = Wrapped()
+    visitor.dispatch(Block(Use('x'), x=1), doorbell.Scope())
+    assert visitor.found == [1]
+    assert visitor.paths[0] == 'wrapped'
+
+
+def test_deep():
+    tree = node = Block(x=0)
+    for i in range(5000):
+        child = Block(x=i + 1)
+        node.children.append(child)
+        node = child
+    node.children.append(Use('x'))
+    visitor = Resolve()
+    visitor.dispatch(tree, doorbell.Scope())
+    assert visitor.found == [5000]
+    assert visitor.paths[0].depth == 5001
+
+
+def test_scope():
+    outer = doorbell.Scope({'x': 1})
+    inner = outer.child(y=2)
+    assert inner['x'] == 1 and inner['y'] == 2
+    assert 'y' in inner and 'y' not in outer
+    assert inner.get('z') is None
+    with pytest.raises(KeyError):
+        inner['z']
+    assert repr(inner) == "Scope({'y': 2}, {'x': 1})"
@@ -0,0 +1,167 @@
+import pickle
+
+import doorbell
+import pytest
+
+
+@doorbell.Visitee.create
+class Node(object):
+    def __init__(self, name, *children):
+        self.name = name
+        self.children = tuple(children)
+
+
+class Names(doorbell.FoldVisitor):
+    """concatenates names in pre-order; associative, not commutative"""
+    identity = ''
+    chunk_size = 3
+
+    def __init__(self):
+        super(Names, self).__init__()
+        self.visited = []
+        self.combined = 0
+
+    def _combine(self, left, right):
+        self.combined += 1
+        return left + right
+
+    def visit_Node(self, subject, children, prefix=''):
+        self.visited.append(subject.name)
+        return prefix + subject.name + children
+
+
+def wide(count):
+    return Node('r', *[Node(str(i % 10), Node('x')) for i in range(count)])
+
+
+def expected(count):
+    return 'r' + ''.join(str(i % 10) + 'x' for i in range(count))
+
+
+def test_fold():
+    assert Names().dispatch(Node('a', Node('b', Node('c')), Node('d'))) == \
+        'abcd'
+
+
+def test_identity():
+    class Count(doorbell.FoldVisitor):
+        identity = 0
+
+        def _combine(self, left, right):
+            return left + right
+
+        def visit_Node(self, subject, children):
+            assert children == 0 or subject.children
+            return 1 + children
+
+    assert Count().dispatch(wide(100)) == 201
+
+
+def test_chunks():
+    for count in (0, 1, 2, 3, 4, 7, 9, 10, 100):
+        assert Names().dispatch(wide(count)) == expected(count)
+
+
+def test_root_args():
+    assert Names().visit_Node(wide(2), '>') == '>' + expected(2)
+
+
+class Executor(object):
+    """records the chunks combined through it"""
+    def __init__(self):
+        self.chunks = []
+
+    def map(self, function, chunks):
+        chunks = list(chunks)
+        self.chunks.extend(chunks)
+        return map(function, chunks)
+
+
+def test_executor():
+    visitor = Names()
+    visitor.executor = Executor()
+    assert visitor.dispatch(wide(100)) == expected(100)
+    assert len(visitor.executor.chunks) > 1
+
+
+def test_process_pool():
+    futures = pytest.importorskip('concurrent.futures')
+    serial = Names()
+    serial.dispatch(wide(20))
+    visitor = Names()
+    with futures.ProcessPoolExecutor(max_workers=2) as executor:
+        visitor.executor = executor
+        assert visitor.dispatch(wide(20)) == expected(20)
+    # the 20 combinations of the root's chunks were made by copies
+    assert visitor.combined == serial.combined - 20
+
+
+def test_copy():
+    visitor = Names()
+    visitor.incremental = True
+    visitor.executor = Executor()
+    visitor.dispatch(wide(10))
+    clone = pickle.loads(pickle.dumps(visitor))
+    assert clone.incremental and clone.executor is None
+    assert clone._results == {} and clone._partials == {}
+    assert clone.dispatch(wide(10)) == expected(10)
+
+
+def test_post():
+    class Upper(Names):
+        def _wrap_each_post(self, arg):
+            return arg.upper()
+
+    assert Upper().dispatch(Node('a', Node('b'))) == 'AB'
+
+
+def test_wrapper():
+    class Wrapped(Names):
+        def _visit_wrapper(self, *args, **kwargs):
+            return super(Wrapped, self)._visit_wrapper(*args, **kwargs)
+
+    assert Wrapped().dispatch(wide(10)) == expected(10)
+
+
+def check_incremental(visitor):
+    tree = wide(30)
+    assert visitor.dispatch(tree) == expected(30)
+    # replace one child: a new root shares the other children
+    children = list(tree.children)
+    children[4] = Node('!', Node('x'))
+    changed = Node('r', *children)
+    visitor.visited = []
+    visitor.combined = 0
+    result = visitor.dispatch(changed)
+    assert result == expected(30).replace('4x', '!x', 1)
+    assert visitor.visited == ['x', '!', 'r']
+    # the new child's own child, the chunk of three children holding it,
+    # then the ten partial results
+    assert visitor.combined == 1 + 3 + 9
+    visitor.clear_cache()
+    visitor.visited = []
+    assert visitor.dispatch(changed) == result
+    assert len(visitor.visited) == 61
+
+
+def test_incremental():
+    class Incremental(Names):
+        incremental = True
+
+    check_incremental(Incremental())
+
+
+def test_incremental_instance():
+    visitor = Names()
+    assert visitor.dispatch(wide(3)) == expected(3)
+    visitor.incremental = True
+    check_incremental(visitor)
+
+
+def test_combine_required():
+    class Missing(doorbell.FoldVisitor):
+        def visit_Node(self, subject, children):
+            return children
+
+    with pytest.raises(TypeError):
+        Missing()
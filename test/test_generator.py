@@ -0,0 +1,119 @@
+import doorbell
+import pytest
+
+
+@doorbell.Visitee.create
+class Node(object):
+    def __init__(self, value, *children):
+        self.value = value
+        self.children = list(children)
+
+
+@doorbell.Visitee.create
+class Leaf(Node):
+    pass
+
+
+@doorbell.Visitee.create
+class Fail(Node):
+    pass
+
+
+class Opaque(Node):
+    def accept(self, visitor, *args):
+        return visitor.visit_Node(self, *args)
+
+
+class Sum(doorbell.GeneratorVisitor):
+    def __init__(self):
+        super(Sum, self).__init__()
+        self.visited = []
+
+    def visit_Node(self, subject, scale=1):
+        self.visited.append(subject.value)
+        total = subject.value
+        for child in subject.children:
+            total += yield child
+        return total * scale
+
+    def visit_Leaf(self, subject):
+        self.visited.append(subject.value)
+        return subject.value
+
+    def visit_Fail(self, subject):
+        raise KeyError(subject.value)
+        yield
+
+
+def tree():
+    return Node(1, Node(2, Leaf(3)), Leaf(4), Opaque(5, Leaf(6)))
+
+
+def test_sum():
+    visitor = Sum()
+    assert visitor.dispatch(tree()) == 21
+    assert visitor.visited == [1, 2, 3, 4, 5, 6]
+    assert not visitor._visiting
+
+
+def test_root_args():
+    assert Sum().visit_Node(tree(), 2) == 42
+
+
+def test_plain_root():
+    assert Sum().dispatch(Leaf(7)) == 7
+
+
+def test_order_and_subset():
+    class Last(Sum):
+        def visit_Node(self, subject):
+            self.visited.append(subject.value)
+            if not subject.children:
+                return subject.value
+            result = yield subject.children[-1]
+            return result
+
+    visitor = Last()
+    assert visitor.dispatch(tree()) == 6
+    assert visitor.visited == [1, 5, 6]
+
+
+def test_deep():
+    root = node = Node(0)
+    for i in range(50000):
+        child = Node(1)
+        node.children.append(child)
+        node = child
+    assert Sum().dispatch(root) == 50000
+
+
+def test_generated():
+    class Count(doorbell.GeneratorVisitor):
+        """count the nodes of a binary tree of the given depth"""
+        def visit_Leaf(self, subject):
+            if subject.value == 0:
+                return 1
+            left = yield Leaf(subject.value - 1)
+            right = yield Leaf(subject.value - 1)
+            return left + right + 1
+
+    assert Count().dispatch(Leaf(10)) == 2 ** 11 - 1
+
+
+def test_exception_caught():
+    class Catch(Sum):
+        def visit_Node(self, subject):
+            try:
+                result = yield subject.children[0]
+            except KeyError as exc:
+                result = exc.args[0]
+            return result
+
+    assert Catch().dispatch(Node(0, Node(1, Fail(9)))) == 9
+
+
+def test_exception_raised():
+    visitor = Sum()
+    with pytest.raises(KeyError):
+        visitor.dispatch(Node(0, Node(1, Fail(9))))
+    assert not visitor._visiting
@@ -0,0 +1,131 @@
+import doorbell
+
+
+@doorbell.Visitee.create
+class Block(object):
+    def __init__(self, name, uses=(), defs=()):
+        self.name = name
+        self.uses = frozenset(uses)
+        self.defs = frozenset(defs)
+        self.children = []
+
+
+class Opaque(Block):
+    def accept(self, visitor, *args):
+        return visitor.visit_Block(self, *args)
+
+
+class Live(doorbell.GraphVisitor):
+    """variables live on entry to each block"""
+    bottom = frozenset()
+
+    def __init__(self):
+        super(Live, self).__init__()
+        self.visited = []
+
+    def _join(self, old, new):
+        return old | new
+
+    def visit_Block(self, subject, children, extra=()):
+        self.visited.append(subject.name)
+        live = frozenset().union(*children) - subject.defs
+        return subject.uses | live | frozenset(extra)
+
+
+def link(*blocks):
+    for a, b in zip(blocks, blocks[1:]):
+        a.children.append(b)
+
+
+def test_dag():
+    a, b, c, d = [Block(n, uses=n) for n in 'abcd']
+    a.children.extend((b, c))
+    b.children.append(d)
+    c.children.append(d)
+    visitor = Live()
+    assert visitor.dispatch(a) == frozenset('abcd')
+    assert visitor.visited.count('d') == 1
+    assert visitor.visited.index('d') < visitor.visited.index('b')
+    assert visitor.visited[-1] == 'a'
+    assert visitor.results[id(c)] == frozenset('cd')
+    assert not visitor._visiting
+
+
+def test_loop():
+    # entry: x = ...; loop: use y, define x; body: use x; exit: use z
+    entry = Block('entry', defs='x')
+    loop = Block('loop', uses='y', defs='x')
+    body = Block('body', uses='x')
+    exit = Block('exit', uses='z')
+    link(entry, loop, body, loop)
+    loop.children.append(exit)
+    visitor = Live()
+    assert visitor.dispatch(entry) == frozenset('yz')
+    assert visitor.results[id(body)] == frozenset('xyz')
+    assert visitor.results[id(loop)] == frozenset('yz')
+    # exit and entry are outside the cycle and visited once
+    assert visitor.visited.count('exit') == 1
+    assert visitor.visited.count('entry') == 1
+    assert visitor.visited.count('loop') <= 3
+
+
+def test_revisit_only_on_change():
+    a, b = Block('a'), Block('b')
+    link(a, b, a)
+    visitor = Live()
+    assert visitor.dispatch(a) == frozenset()
+    assert sorted(visitor.visited) == ['a', 'b']
+
+
+def test_self_loop():
+    a = Block('a', uses='a')
+    a.children.append(a)
+    visitor = Live()
+    assert visitor.dispatch(a) == frozenset('a')
+    assert visitor.visited == ['a', 'a']
+
+
+def test_long_cycle():
+    blocks = [Block(i) for i in range(5000)]
+    blocks[-1].uses = frozenset('v')
+    link(*blocks + [blocks[0]])
+    visitor = Live()
+    assert visitor.dispatch(blocks[0]) == frozenset('v')
+    assert all(r == frozenset('v') for r in visitor.results.values())
+
+
+def test_deep_chain():
+    blocks = [Block(i) for i in range(20000)]
+    link(*blocks)
+    blocks[-1].uses = frozenset('w')
+    assert Live().dispatch(blocks[0]) == frozenset('w')
+
+
+def test_opaque():
+    a, b = Block('a', uses='a'), Opaque('b', uses='b')
+    link(a, b, a)
+    assert Live().dispatch(a) == frozenset('ab')
+
+
+def test_root_args():
+    a, b = Block('a'), Block('b')
+    link(a, b, a)
+    visitor = Live()
+    assert visitor.visit_Block(a, 'r') == frozenset('r')
+    assert visitor.results[id(b)] == frozenset('r')
+
+
+def test_equal():
+    class Count(doorbell.GraphVisitor):
+        """count visits, converging once the count reaches 3"""
+        bottom = 0
+
+        def _equal(self, old, new):
+            return min(old, 3) == min(new, 3)
+
+        def visit_Block(self, subject, children):
+            return max(children) + 1
+
+    a, b = Block('a'), Block('b')
+    link(a, b, a)
+    assert Count().dispatch(a) >= 3
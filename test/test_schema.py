@@ -0,0 +1,151 @@
+import copy
+import pickle
+import sys
+
+import doorbell
+import pytest
+
+
+SCHEMA = {
+    'Expr': {'slots': ['annotation']},
+    'Num': {'bases': ['Expr'], 'fields': ['value']},
+    'BinOp': {'bases': ['Expr'], 'children': ['left', 'right']},
+    'Add': {'bases': ['BinOp']},
+    'Mul': {'bases': ['BinOp'], 'visit': 'Multiply'},
+    'Block': {'bases': ['Expr'], 'fields': ['name'], 'children': ['*body']},
+}
+
+
+class Slotted(object):
+    __slots__ = ('extra',)
+
+
+class Visitor(doorbell.CascadingVisitor):
+    def visit_Num(self, obj, children):
+        return obj.value
+
+    def visit_Add(self, obj, children):
+        return sum(children)
+
+    def visit_Multiply(self, obj, children):
+        return children[0] * children[1]
+
+    def visit_Block(self, obj, children):
+        return children
+
+
+class TestNodeRegistry:
+    def test_lazy(self):
+        nodes = doorbell.NodeRegistry(SCHEMA)
+        assert nodes._classes == {}
+        assert nodes.Add is nodes.Add
+        assert sorted(nodes._classes) == ['Add', 'BinOp', 'Expr']
+        assert 'Mul' in nodes
+        assert 'Mul' in dir(nodes)
+
+    def test_classes(self):
+        nodes = doorbell.NodeRegistry(SCHEMA)
+        assert nodes.Add.__mro__ == (
+            nodes.Add, nodes.BinOp, nodes.Expr, doorbell.Visitee, object)
+        assert nodes.Block._fields == ('name', 'body')
+        num = nodes.Num(value=1)
+        assert not hasattr(num, '__dict__')
+        assert num.children == []
+        num.annotation = 'int'
+        with pytest.raises(TypeError):
+            nodes.Num(1, 2)
+        with pytest.raises(TypeError):
+            nodes.Num(1, value=2)
+
+    def test_visit(self):
+        nodes = doorbell.NodeRegistry(SCHEMA)
+        one = nodes.Num(1)
+        add = nodes.Add(one, nodes.Num(2))
+        block = nodes.Block('b', [add, nodes.Mul(add, add)])
+        assert block.accept(Visitor()) == [3, 9]
+        assert nodes.Block().body == []
+        assert nodes.Add(one).children == [one]
+
+    def test_module(self):
+        nodes = doorbell.NodeRegistry(SCHEMA, module=__name__)
+        module = sys.modules[__name__]
+        assert not hasattr(module, 'Num')
+        try:
+            assert nodes.Num.__module__ == __name__
+            assert module.Num is nodes.Num
+        finally:
+            del module.Num
+
+    def test_default_module(self):
+        nodes = doorbell.NodeRegistry(SCHEMA)
+        assert nodes.Num.__module__ == __name__
+
+    def test_pickle(self):
+        nodes = doorbell.NodeRegistry(SCHEMA, module=__name__)
+        module = sys.modules[__name__]
+        try:
+            num = nodes.Num(1)
+            copied = pickle.loads(pickle.dumps(num, pickle.HIGHEST_PROTOCOL))
+            assert type(copied) is nodes.Num
+            assert copied.value == 1
+        finally:
+            del module.Num
+
+    def test_copy(self):
+        nodes = copy.copy(doorbell.NodeRegistry(SCHEMA))
+        assert nodes.Num(1).value == 1
+        with pytest.raises(AttributeError):
+            nodes.__missing__
+
+    def test_inherited_fields(self):
+        nodes = doorbell.NodeRegistry({
+            'Base': {'fields': ['x']},
+            'Child': {'bases': ['Base'], 'fields': ['x', 'y']},
+        })
+        assert nodes.Child.__slots__ == ('y',)
+        assert nodes.Child._fields == ('x', 'y')
+        child = nodes.Child(1, 2)
+        assert (child.x, child.y) == (1, 2)
+
+    def test_shared_layout(self):
+        nodes = doorbell.NodeRegistry({
+            'Base': {'fields': ['x']},
+            'Left': {'bases': ['Base'], 'fields': ['y']},
+            'Right': {'bases': ['Base']},
+            'Both': {'bases': ['Left', 'Right']},
+        })
+        assert nodes.Both(1, 2).y == 2
+        nodes = doorbell.NodeRegistry({
+            'Base': {'bases': [Slotted]},
+            'Child': {'bases': ['Base'], 'fields': ['x']},
+        })
+        assert nodes.Child(1).x == 1
+
+    def test_unicode_bases(self):
+        nodes = doorbell.NodeRegistry({
+            u'Expr': {}, u'Num': {'bases': [u'Expr'], 'fields': ['value']}})
+        assert issubclass(nodes.Num, nodes.Expr)
+
+    def test_missing(self):
+        nodes = doorbell.NodeRegistry(SCHEMA)
+        with pytest.raises(AttributeError):
+            nodes.Sub
+
+    @pytest.mark.parametrize('schema', [
+        {'Bad Name': {}},
+        {'Num': {'fields': ['a-b']}},
+        {'Num': {'visit': '1'}},
+        {'Num': {'bases': ['Missing']}},
+        {'Num': {'extra': True}},
+        {'Num': {'bases': ['Num']}},
+        {'A': {'bases': ['B']}, 'B': {'bases': ['A']}},
+        {'A': {'bases': ['B']}, 'B': {'bases': ['C']}, 'C': {'bases': ['A']}},
+        {'A': {'fields': ['x']}, 'B': {'children': ['y']},
+         'C': {'bases': ['A', 'B']}},
+        {'A': {'slots': ['x']}, 'B': {'bases': ['A'], 'fields': ['y']},
+         'C': {'fields': ['z']}, 'D': {'bases': ['B', 'C']}},
+        {'A': {'fields': ['x']}, 'B': {'bases': ['A', Slotted]}},
+    ])
+    def test_invalid(self, schema):
+        with pytest.raises(ValueError):
+            doorbell.NodeRegistry(schema)
@@ -0,0 +1,89 @@
+import doorbell
+import itertools
+import pickle
+
+
+@doorbell.Visitee.create
+class Tree(object):
+    def __init__(self, name, *children):
+        self.name = name
+        self.children = list(children)
+
+
+def events(visitor, tree, skip=()):
+    walk = visitor.walk(tree)
+    result = []
+    for event, node, depth in walk:
+        result.append((event, node.name, depth))
+        if event is doorbell.ENTER and node.name in skip:
+            assert walk.send(doorbell.SKIP) is None
+    return result
+
+
+def test_order():
+    tree = Tree('a', Tree('b', Tree('c')), Tree('d'))
+    E, L = doorbell.ENTER, doorbell.LEAVE
+    assert events(doorbell.Visitor(), tree) == [
+        (E, 'a', 0), (E, 'b', 1), (E, 'c', 2), (L, 'c', 2), (L, 'b', 1),
+        (E, 'd', 1), (L, 'd', 1), (L, 'a', 0)]
+
+
+def test_skip():
+    tree = Tree('a', Tree('b', Tree('c')), Tree('d', Tree('e')))
+    names = [n for e, n, d in events(doorbell.Visitor(), tree, skip='bd')
+             if e is doorbell.ENTER]
+    assert names == ['a', 'b', 'd']
+
+
+def test_skip_equal_string():
+    tree = Tree('a', Tree('b'))
+    walk = doorbell.Visitor().walk(tree)
+    next(walk)
+    assert walk.send('SKIP') == (doorbell.ENTER, tree.children[0], 1)
+
+
+def test_signals():
+    signals = [doorbell.ENTER, doorbell.LEAVE, doorbell.SKIP, doorbell.STOP]
+    assert [repr(i) for i in signals] == ['ENTER', 'LEAVE', 'SKIP', 'STOP']
+    for signal in signals:
+        assert pickle.loads(pickle.dumps(signal)) is signal
+
+
+def test_skip_root():
+    tree = Tree('a', Tree('b'))
+    assert events(doorbell.Visitor(), tree, skip='a') == [
+        (doorbell.ENTER, 'a', 0), (doorbell.LEAVE, 'a', 0)]
+
+
+def test_lazy():
+    def children(n):
+        for i in itertools.count():
+            yield Tree(i)
+
+    class Infinite(doorbell.Visitor):
+        def _gather_children(self, subject):
+            return children(subject)
+
+    walk = Infinite().walk(Tree('root'))
+    first = list(itertools.islice(walk, 4))
+    assert [d for e, n, d in first] == [0, 1, 2, 3]
+
+
+def test_kind():
+    class Plain(doorbell.Visitor):
+        kind_key = 'kind'
+        children_key = 'args'
+
+    tree = {'kind': 'add', 'args': [{'kind': 'num'}, {'kind': 'num'}]}
+    enters = [depth for event, node, depth in Plain().walk(tree)
+              if event is doorbell.ENTER]
+    assert enters == [0, 1, 1]
+
+
+def test_deep():
+    tree = node = Tree(0)
+    for i in range(10000):
+        child = Tree(i + 1)
+        node.children.append(child)
+        node = child
+    assert max(d for e, n, d in doorbell.Visitor().walk(tree)) == 10000
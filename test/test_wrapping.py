@@ -1,4 +1,5 @@
 import doorbell
+import pytest
 
 
 class TestNonVisitorDecorator:
@@ -39,3 +40,92 @@ class TestBasicWrapping:
         v = self.Value(1)
         a = self.Visitor()
         assert v.accept(a) == 1
+
+
+class TestSpecialized:
+    class Value(doorbell.Visitee):
+        def __init__(self, value=0):
+            self.value = value
+
+        def accept(self, visitor, *args):
+            return visitor.visit_Value(self, *args)
+
+    class Plain(doorbell.WrappingVisitor):
+        def visit_Value(self, obj, *args):
+            return obj.value, args
+
+    class EachPost(Plain):
+        def _wrap_each_post(self, arg):
+            return ('each', arg)
+
+    class EachPre(Plain):
+        def _wrap_each_pre(self, obj, *args):
+            return (obj, 'pre') + args
+
+    class AllHooks(EachPre, EachPost):
+        def _wrap_all_pre(self, obj, *args):
+            return (obj, 'all') + args
+
+        def _wrap_all_post(self, arg):
+            return ('all', arg)
+
+    shapes = (Plain, EachPost, EachPre, AllHooks)
+
+    @staticmethod
+    def generic(cls):
+        class Generic(cls):
+            def _visit_wrapper(self, *args, **kwargs):
+                return super(Generic, self)._visit_wrapper(*args, **kwargs)
+        return Generic
+
+    def test_identical(self):
+        for cls in self.shapes:
+            value = self.Value(1)
+            generic = self.generic(cls)()
+            specialized = cls()
+            assert generic.visit_Value.func == generic._visit_wrapper
+            for args in ((), (2, 3)):
+                assert (value.accept(specialized, *args) ==
+                        value.accept(generic, *args))
+
+    def test_identity_hooks_skipped(self):
+        v = self.Plain()
+        assert v.visit_Value.__func__ is vars(self.Plain)[
+            'visit_Value'].function
+
+    def test_visiting_reset(self):
+        class Failing(self.AllHooks):
+            def visit_Value(self, obj, *args):
+                raise RuntimeError()
+
+        v = Failing()
+        try:
+            self.Value().accept(v)
+        except RuntimeError:
+            pass
+        assert not v._visiting
+
+    def test_specializable(self):
+        class Marked(self.Plain):
+            @doorbell._specializable
+            def _visit_wrapper(self, *args, **kwargs):
+                raise NotImplementedError()
+
+        assert self.Value(1).accept(Marked()) == (1, ())
+        with pytest.raises(NotImplementedError):
+            self.Value(1).accept(self.generic(Marked)())
+
+    def test_visiting(self):
+        def visiting(self, obj, *args):
+            return self._visiting
+
+        class Plain(self.Plain):
+            visit_Value = visiting
+
+        class AllHooks(self.AllHooks):
+            visit_Value = visiting
+
+        # only kept where outermost calls differ from nested calls
+        assert self.Value().accept(Plain()) is False
+        assert self.Value().accept(self.generic(Plain)()) is True
+        assert self.Value().accept(AllHooks()) == ('all', ('each', True))